@@ -0,0 +1,167 @@
+import argparse
+import random
+import time
+
+import numpy as np
+
+from Bitboard import COLUMNS, HEIGHT, ROWS, Bitboard
+from Evaluation import WINDOW_COUNT, WINDOW_INDEX, WINDOW_MASKS, evaluate
+
+# batch evaluation works on numpy uint64 bitboards and so only on the standard board (Geometry.fits_uint64)
+
+# status value of positions that are not finished, the others use the values of board_state
+ONGOING = -1
+
+# positions are processed in chunks so that the (N, 69, 4) window arrays stay small
+CHUNK_SIZE = 1 << 16
+
+WINDOW_MASKS_U64 = np.array(WINDOW_MASKS, dtype=np.uint64)
+
+# bit of every square of the array layout, shape (ROWS, COLUMNS)
+SQUARE_BITS = np.array([[j * HEIGHT + (ROWS - 1 - i) for j in range(COLUMNS)] for i in range(ROWS)], dtype=np.uint64)
+
+
+# converts an (N, 2) array of (blue, red) bitboards to (N, ROWS, COLUMNS) int8 boards
+def bitboards_to_arrays(bitboards):
+    bitboards = np.asarray(bitboards, dtype=np.uint64)
+    blue = (bitboards[:, 0, None, None] >> SQUARE_BITS) & np.uint64(1)
+    red = (bitboards[:, 1, None, None] >> SQUARE_BITS) & np.uint64(1)
+    return (blue + 2 * red).astype(np.int8)
+
+
+# converts (N, ROWS, COLUMNS) boards to an (N, 2) array of (blue, red) bitboards
+def arrays_to_bitboards(boards):
+    boards = np.asarray(boards)
+    weights = np.uint64(1) << SQUARE_BITS
+    blue = np.where(boards == 1, weights, np.uint64(0)).reshape(len(boards), -1).sum(axis=1, dtype=np.uint64)
+    red = np.where(boards == 2, weights, np.uint64(0)).reshape(len(boards), -1).sum(axis=1, dtype=np.uint64)
+    return np.stack([blue, red], axis=1)
+
+
+# number of blue and red pieces in every window, shape (N, WINDOW_COUNT) each
+def _window_counts(chunk, bitboards):
+    if bitboards and hasattr(np, 'bitwise_count'):
+        blue = np.bitwise_count(chunk[:, 0, None] & WINDOW_MASKS_U64).astype(np.int8)
+        red = np.bitwise_count(chunk[:, 1, None] & WINDOW_MASKS_U64).astype(np.int8)
+        full = np.bitwise_count(chunk[:, 0] | chunk[:, 1]) == ROWS * COLUMNS
+        return blue, red, full
+    if bitboards:
+        chunk = bitboards_to_arrays(chunk)
+    flat = chunk.reshape(len(chunk), ROWS * COLUMNS)
+    windows = flat[:, WINDOW_INDEX]
+    blue = (windows == 1).sum(axis=2, dtype=np.int8)
+    red = (windows == 2).sum(axis=2, dtype=np.int8)
+    full = (flat != 0).all(axis=1)
+    return blue, red, full
+
+
+def _as_positions(positions):
+    positions = np.asarray(positions)
+    bitboards = positions.ndim == 2
+    if bitboards:
+        if positions.shape[1] != 2:
+            raise ValueError('bitboards have to be of shape (N, 2)')
+        positions = positions.astype(np.uint64, copy=False)
+    elif positions.shape[1:] != (ROWS, COLUMNS):
+        raise ValueError('boards have to be of shape (N, {}, {})'.format(ROWS, COLUMNS))
+    return positions, bitboards
+
+
+# status (like board_state, ONGOING for unfinished games) and the heuristic features of many positions at once
+# possible and threats are blue minus red like in Evaluation.count_features
+def count_features_batch(positions):
+    (positions, bitboards) = _as_positions(positions)
+    n = len(positions)
+    status = np.empty(n, dtype=np.int8)
+    possible = np.empty(n, dtype=np.int16)
+    threats = np.empty(n, dtype=np.int16)
+    for start in range(0, n, CHUNK_SIZE):
+        chunk = positions[start:start + CHUNK_SIZE]
+        (blue, red, full) = _window_counts(chunk, bitboards)
+
+        blue_won = (blue == 4).any(axis=1)
+        red_won = (red == 4).any(axis=1)
+        status[start:start + len(chunk)] = np.where(blue_won, 1, np.where(red_won, 2, np.where(full, 0, ONGOING)))
+        possible[start:start + len(chunk)] = (red == 0).sum(axis=1) - (blue == 0).sum(axis=1)
+        threats[start:start + len(chunk)] = \
+            ((blue == 3) & (red == 0)).sum(axis=1) - ((red == 3) & (blue == 0)).sum(axis=1)
+    return status, possible, threats
+
+
+# status (like board_state, ONGOING for unfinished games) and heuristic value of many positions at once
+# positions are an (N, ROWS, COLUMNS) array of 0, 1 and 2 or an (N, 2) uint64 array of (blue, red) bitboards
+def evaluate_batch(positions, alpha, beta):
+    (status, possible, threats) = count_features_batch(positions)
+    # same operation order as Evaluation.score, so the values are identical to the single board evaluators
+    scores = possible / WINDOW_COUNT * alpha + threats / WINDOW_COUNT * beta
+    # finished games get their result like in the heuristic
+    scores = np.where(status == 1, 1.0, np.where(status == 2, -1.0, np.where(status == 0, 0.0, scores)))
+    return status, scores
+
+
+# random positions from random games, some of them finished, as (N, 2) bitboards
+def random_positions(n, seed=0):
+    rng = random.Random(seed)
+    bitboards = np.empty((n, 2), dtype=np.uint64)
+    for k in range(n):
+        position = Bitboard()
+        for ply in range(rng.randrange(ROWS * COLUMNS + 1)):
+            if position.state() is not None:
+                break
+            position.play(rng.choice(position.legal_moves()))
+        bitboards[k] = position.pieces
+    return bitboards
+
+
+# compares the batch results with the single board rules and evaluator
+def check_batch(n=2000, seed=0, alpha=0.5, beta=0.5):
+    bitboards = random_positions(n, seed)
+    boards = bitboards_to_arrays(bitboards)
+    for positions in (bitboards, boards):
+        (status, scores) = evaluate_batch(positions, alpha, beta)
+        for k in range(n):
+            position = Bitboard.from_array(boards[k])
+            state = position.state()
+            expected = evaluate(position, alpha, beta) if state is None else (-1 if state == 2 else state)
+            if status[k] != (ONGOING if state is None else state) or scores[k] != expected:
+                raise AssertionError('{!r}: batch result differs'.format(position))
+    if not (arrays_to_bitboards(boards) == bitboards).all():
+        raise AssertionError('array to bitboard conversion differs')
+    return True
+
+
+# prints the positions per second of evaluate_batch for growing N for both input formats
+def benchmark(max_n=10 ** 6, pool=10000, seed=0):
+    pool_bitboards = random_positions(pool, seed)
+    rng = np.random.default_rng(seed)
+    print('{:>9} {:>10} {:>14} {:>14}'.format('N', 'format', 'seconds', 'positions/s'))
+    n = 1
+    while n <= max_n:
+        bitboards = pool_bitboards[rng.integers(0, pool, n)]
+        for (name, positions) in (('bitboard', bitboards), ('array', bitboards_to_arrays(bitboards))):
+            start = time.perf_counter()
+            evaluate_batch(positions, 0.5, 0.5)
+            elapsed = time.perf_counter() - start
+            print('{:>9} {:>10} {:>14.6f} {:>14.0f}'.format(n, name, elapsed, n / elapsed))
+        n *= 10
+
+    # the single board loop for comparison
+    positions = [Bitboard.from_array(board) for board in bitboards_to_arrays(pool_bitboards[:1000])]
+    start = time.perf_counter()
+    for position in positions:
+        if position.state() is None:
+            evaluate(position, 0.5, 0.5)
+    elapsed = time.perf_counter() - start
+    print('{:>9} {:>10} {:>14.6f} {:>14.0f}'.format(len(positions), 'loop', elapsed, len(positions) / elapsed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='batch evaluation of connect 4 positions')
+    parser.add_argument('--check', action='store_true', help='compare the batch results with the single board code')
+    parser.add_argument('--max-n', type=int, default=10 ** 6, help='largest batch of the benchmark')
+    args = parser.parse_args()
+    if args.check:
+        check_batch()
+        print('batch results agree with the single board evaluation')
+    else:
+        benchmark(args.max_n)
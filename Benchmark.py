@@ -0,0 +1,244 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+from Bitboard import Bitboard, board_geometry, position_from_moves, random_opening
+from Evaluation import Evaluator, evaluate
+from Game import ALPHA, BETA, Game
+from Search import Search
+from TranspositionTable import TranspositionTable
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'corpus_v1.txt')
+
+# number of random moves of the corpus categories
+CATEGORIES = {'opening': (2, 6), 'midgame': (14, 22), 'endgame': (30, 36)}
+
+# board sizes of the per size search benchmark as (rows, columns, connect)
+SIZES = [(6, 7, 4), (7, 8, 4), (8, 9, 4), (7, 9, 5)]
+
+# metrics where a higher value is better, all others are better when lower
+HIGHER_IS_BETTER = ('nodes_per_second', 'games_per_second')
+
+
+# random positions of every category that are not finished, written as 'category moves' lines
+def make_corpus(path, per_category=10, seed=1):
+    rng = random.Random(seed)
+    lines = []
+    for (category, (low, high)) in CATEGORIES.items():
+        count = 0
+        while count < per_category:
+            position = Bitboard()
+            random_opening(position, rng.randint(low, high), rng)
+            if len(position.history) < low:
+                continue
+            lines.append('{} {}'.format(category, ''.join(str(j + 1) for j in position.history)))
+            count += 1
+    with open(path, 'w') as f:
+        f.write('# benchmark corpus: category and played columns from 1 to 7, do not change, add a new version\n')
+        f.write('\n'.join(lines) + '\n')
+
+
+# list of (category, moves) of a corpus file
+def load_corpus(path=CORPUS_PATH):
+    corpus = []
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                (category, moves) = line.split()
+                corpus.append((category, moves))
+    return corpus
+
+
+# seconds of one call, every round runs until min_time has passed and the fastest round counts
+def _latency(function, min_time=0.05, rounds=5):
+    best = None
+    for r in range(rounds):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            for k in range(20):
+                function()
+            calls += 20
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = elapsed / calls if best is None else min(best, elapsed / calls)
+    return best
+
+
+# fixed depth searches of every corpus position, returns nodes per second and milliseconds to depth per category
+# every search runs repeat times with a fresh table and the fastest run counts
+def bench_search(corpus, depth, repeat=3):
+    nodes = 0
+    total = 0.0
+    per_category = {}
+    for (category, moves) in corpus:
+        position = position_from_moves(moves)
+        evaluator = Evaluator(ALPHA, BETA)
+        evaluator.attach(position)
+        elapsed = None
+        for k in range(repeat):
+            search = Search(lambda p: evaluator.value(), TranspositionTable(16))
+            start = time.perf_counter()
+            search.iterate(position, depth)
+            t = time.perf_counter() - start
+            elapsed = t if elapsed is None else min(elapsed, t)
+        nodes += search.nodes
+        total += elapsed
+        per_category.setdefault(category, []).append(elapsed)
+    results = {'nodes_per_second': nodes / total}
+    for (category, times) in per_category.items():
+        results['time_to_depth_{}_ms'.format(category)] = 1000 * sum(times) / len(times)
+    return results
+
+
+# nodes per second of fixed depth searches on random positions of every board size, the fastest of repeat runs
+def bench_sizes(depth, positions=5, seed=0, repeat=3):
+    results = {}
+    for (rows, columns, connect) in SIZES:
+        geometry = board_geometry(rows, columns, connect)
+        rng = random.Random(seed)
+        nodes = 0
+        total = 0.0
+        for k in range(positions):
+            position = Bitboard(geometry)
+            random_opening(position, rng.randrange(2, 12), rng)
+            evaluator = Evaluator(ALPHA, BETA)
+            evaluator.attach(position)
+            elapsed = None
+            for r in range(repeat):
+                search = Search(lambda p: evaluator.value(), TranspositionTable(16))
+                start = time.perf_counter()
+                search.iterate(position, depth)
+                t = time.perf_counter() - start
+                elapsed = t if elapsed is None else min(elapsed, t)
+            nodes += search.nodes
+            total += elapsed
+        results['nodes_per_second_{}x{}_connect{}'.format(rows, columns, connect)] = nodes / total
+    return results
+
+
+# latency of the rules and heuristic calls of Game and of the engine in microseconds
+def bench_calls(corpus):
+    games = []
+    for (category, moves) in corpus:
+        game = Game()
+        for c in moves:
+            game.position.play(int(c) - 1)
+        games.append(game)
+    positions = [game.position for game in games]
+    return {
+        'board_state_us': 1e6 * _latency(lambda: [game.board_state() for game in games]) / len(games),
+        'heuristic_us': 1e6 * _latency(lambda: [game.heuristic(ALPHA, BETA) for game in games]) / len(games),
+        'evaluate_us': 1e6 * _latency(lambda: [evaluate(p, ALPHA, BETA) for p in positions]) / len(positions),
+    }
+
+
+# complete games of play_ai_only at a fixed depth with random openings, the fastest of repeat runs counts
+def bench_games(games, depth, seed=0, repeat=3):
+    best = None
+    for r in range(repeat):
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        for k in range(games):
+            game = Game(depth, None)
+            random_opening(game.position, 4, rng)
+            with contextlib.redirect_stdout(io.StringIO()):
+                game.play_ai_only()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {'games_per_second': games / best}
+
+
+# peak python memory of a search with tracemalloc, separate because tracing slows everything down
+def bench_memory(corpus, depth):
+    tracemalloc.start()
+    bench_search(corpus[:3], depth, 1)
+    (current, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'peak_traced_mb': peak / (1024 * 1024)}
+
+
+def run(corpus_path=CORPUS_PATH, depth=7, games=10, game_depth=5, size_depth=6):
+    corpus = load_corpus(corpus_path)
+    results = {}
+    results.update(bench_search(corpus, depth))
+    results.update(bench_sizes(size_depth))
+    results.update(bench_calls(corpus))
+    results.update(bench_games(games, game_depth))
+    results.update(bench_memory(corpus, depth))
+    results['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {
+        'corpus': os.path.basename(corpus_path),
+        'positions': len(corpus),
+        'depth': depth,
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': {key: round(value, 4) for (key, value) in results.items()},
+    }
+
+
+# metrics of new that are worse than in base by more than threshold (0.1 is 10 percent)
+def compare(base, new, threshold):
+    regressions = []
+    for (key, old) in base['results'].items():
+        if key not in new['results'] or old == 0:
+            continue
+        value = new['results'][key]
+        change = (value - old) / old
+        worse = -change if key.startswith(HIGHER_IS_BETTER) else change
+        regressions.append((key, old, value, change, worse > threshold))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='benchmarks of the engine on a fixed position corpus')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run all benchmarks and write the results as json')
+    run_parser.add_argument('--corpus', default=CORPUS_PATH)
+    run_parser.add_argument('--depth', type=int, default=7, help='search depth of the corpus searches')
+    run_parser.add_argument('--games', type=int, default=10, help='number of play_ai_only games')
+    run_parser.add_argument('--size-depth', type=int, default=6, help='search depth of the per size benchmark')
+    run_parser.add_argument('--out', default=None, help='json file, printed if not given')
+    compare_parser = commands.add_parser('compare', help='flag metrics that got worse than the threshold')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative change')
+    corpus_parser = commands.add_parser('corpus', help='write a new random corpus')
+    corpus_parser.add_argument('--out', required=True)
+    corpus_parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        results = run(args.corpus, args.depth, args.games, size_depth=args.size_depth)
+        text = json.dumps(results, indent=2)
+        if args.out:
+            with open(args.out, 'w') as f:
+                f.write(text + '\n')
+        print(text)
+    elif args.command == 'compare':
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        failed = False
+        for (key, old, value, change, regression) in compare(base, new, args.threshold):
+            print('{:<28} {:>14.4f} {:>14.4f} {:>+8.1%} {}'.format(key, old, value, change,
+                                                                   'REGRESSION' if regression else ''))
+            failed = failed or regression
+        sys.exit(1 if failed else 0)
+    else:
+        make_corpus(args.out, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,358 @@
+import random
+
+import numpy as np
+
+# size of the standard board and the number of pieces in a row that wins
+ROWS = 6
+COLUMNS = 7
+CONNECT = 4
+
+
+# board size and win length with the bit tables of their layout, board_geometry() builds each one only once
+# bit index of a square is column * height + row, row 0 is the bottom row
+class Geometry:
+    def __init__(self, rows, columns, connect):
+        if connect < 2 or connect > max(rows, columns):
+            raise ValueError('{} in a row can not be played on {}x{}'.format(connect, rows, columns))
+        self.rows = rows
+        self.columns = columns
+        self.connect = connect
+        # every column uses rows + 1 bits, the extra bit on top stays empty so that shifts never wrap into the next
+        self.height = rows + 1
+        self.bits = self.height * columns
+        self.size = rows * columns
+        # boards of up to 64 bits also fit into numpy uint64 arrays, larger ones only use python ints
+        self.fits_uint64 = self.bits <= 64
+        self.bottom_mask = sum(1 << (j * self.height) for j in range(columns))
+        self.board_mask = self.bottom_mask * ((1 << rows) - 1)
+        # first bit above every column, a column is full when its height reaches it
+        self.tops = [j * self.height + rows for j in range(columns)]
+        # columns in the center take part in more lines, so they are tried first
+        self.center_order = sorted(range(columns), key=lambda j: abs(j - columns // 2))
+        # shifts between neighbouring squares: horizontal, both diagonals and vertical
+        self.shifts = (self.height, self.height + 1, self.height - 1, 1)
+
+        # random 64 bit numbers for every player and square, the hash of a position is the xor of its pieces
+        rng = random.Random(0x43344334)
+        self.zobrist = [[rng.getrandbits(64) for i in range(self.bits)] for player in range(2)]
+        # numbers of the mirrored squares, the xor of them is the hash of the left-right mirrored position
+        self.mirror_zobrist = [[numbers[self.mirror_bit(bit)] for bit in range(self.bits)] for numbers in self.zobrist]
+
+        # masks of the lines of connect squares through every square
+        self.line_masks = [[] for bit in range(self.bits)]
+        for j in range(columns):
+            for r in range(rows):
+                # horizontal, vertical and both diagonals that start in this square
+                for (dj, dr) in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                    cells = [(j + k * dj, r + k * dr) for k in range(connect)]
+                    if all(0 <= c < columns and 0 <= row < rows for (c, row) in cells):
+                        line = sum(1 << (c * self.height + row) for (c, row) in cells)
+                        for (c, row) in cells:
+                            self.line_masks[c * self.height + row].append(line)
+
+    # checks a single player mask for connect in a row, runs double in length with every shift and and
+    def is_win(self, pieces):
+        connect = self.connect
+        for shift in self.shifts:
+            m = pieces
+            length = 1
+            while 2 * length <= connect:
+                m &= m >> (length * shift)
+                length *= 2
+            if length < connect:
+                m &= m >> ((connect - length) * shift)
+            if m:
+                return True
+        return False
+
+    # bit of the square in the mirrored column
+    def mirror_bit(self, bit):
+        (j, r) = divmod(bit, self.height)
+        return (self.columns - 1 - j) * self.height + r
+
+    # mirrors a bit mask left to right, also position keys because a column of a key never carries into the next
+    def mirror(self, bits):
+        column = (1 << self.height) - 1
+        mirrored = 0
+        for j in range(self.columns):
+            mirrored |= ((bits >> (j * self.height)) & column) << ((self.columns - 1 - j) * self.height)
+        return mirrored
+
+    def __repr__(self):
+        return 'Geometry({}, {}, {})'.format(self.rows, self.columns, self.connect)
+
+
+_geometries = {}
+
+
+# the shared Geometry of a board size, its tables are built on the first call
+def board_geometry(rows=ROWS, columns=COLUMNS, connect=CONNECT):
+    key = (rows, columns, connect)
+    if key not in _geometries:
+        _geometries[key] = Geometry(rows, columns, connect)
+    return _geometries[key]
+
+
+STANDARD = board_geometry()
+
+# the tables of the standard board, the solver, the batch evaluation and the opening book only use these
+HEIGHT = STANDARD.height
+BOTTOM_MASK = STANDARD.bottom_mask
+BOARD_MASK = STANDARD.board_mask
+ZOBRIST = STANDARD.zobrist
+LINE_MASKS = STANDARD.line_masks
+
+
+# checks a single player mask of the standard board for four in a row with shift and and
+def is_win(pieces):
+    # horizontal
+    m = pieces & (pieces >> HEIGHT)
+    if m & (m >> (2 * HEIGHT)):
+        return True
+
+    # diagonal /
+    m = pieces & (pieces >> (HEIGHT + 1))
+    if m & (m >> (2 * (HEIGHT + 1))):
+        return True
+
+    # diagonal \
+    m = pieces & (pieces >> (HEIGHT - 1))
+    if m & (m >> (2 * (HEIGHT - 1))):
+        return True
+
+    # vertical
+    m = pieces & (pieces >> 1)
+    if m & (m >> 2):
+        return True
+
+    return False
+
+
+# checks only the lines through one square, enough after a piece was placed on it
+def is_win_at(pieces, bit, line_masks=LINE_MASKS):
+    for line in line_masks[bit]:
+        if pieces & line == line:
+            return True
+    return False
+
+
+# plays random opening moves, a move that ends the game is taken back and another one is tried
+def random_opening(position, plies, rng):
+    for ply in range(plies):
+        moves = position.legal_moves()
+        rng.shuffle(moves)
+        for move in moves:
+            position.play(move)
+            if position.state() is None:
+                break
+            position.undo()
+        else:
+            break
+
+
+# compact game state: one mask per player plus the height of every column
+class Bitboard:
+    def __init__(self, geometry=STANDARD):
+        # board size and the tables of its bit layout
+        self.geometry = geometry
+        # pieces[0] belongs to player 1 (blue), pieces[1] to player 2 (red)
+        self.pieces = [0, 0]
+        # index of the next free bit in every column
+        self.heights = [j * geometry.height for j in range(geometry.columns)]
+        # played columns, needed for undo
+        self.history = []
+        self.current_player = 1
+        # zobrist hash, updated on every play and undo
+        self.hash = 0
+        # zobrist hash of the mirrored position, the smaller of both is the same for a position and its mirror
+        self.mirror_hash = 0
+        # optional Evaluation.Evaluator that is told about every play and undo
+        self.evaluator = None
+
+    # number of pieces on the board
+    @property
+    def moves(self):
+        return len(self.history)
+
+    # all occupied squares
+    @property
+    def mask(self):
+        return self.pieces[0] | self.pieces[1]
+
+    # number that identifies the position, adding the mask keeps the pieces of different column heights apart
+    def key(self):
+        return self.pieces[0] + (self.pieces[0] | self.pieces[1])
+
+    # key of the position or of its mirror, whichever is smaller, and if it is the mirror
+    # moves stored under a mirrored key have to be mirrored with mirror_move
+    def canonical_key(self):
+        key = self.key()
+        mirrored = self.geometry.mirror(key)
+        if mirrored < key:
+            return mirrored, True
+        return key, False
+
+    # column of a move in the mirrored position
+    def mirror_move(self, column):
+        return self.geometry.columns - 1 - column
+
+    # copies the position without the attached evaluator
+    def copy(self):
+        other = Bitboard(self.geometry)
+        other.pieces = self.pieces[:]
+        other.heights = self.heights[:]
+        other.history = self.history[:]
+        other.current_player = self.current_player
+        other.hash = self.hash
+        other.mirror_hash = self.mirror_hash
+        return other
+
+    # checks if the column has a free square
+    def can_play(self, column):
+        return self.heights[column] < self.geometry.tops[column]
+
+    # mask with the lowest free square of every playable column set
+    def legal_moves_mask(self):
+        return (self.mask + self.geometry.bottom_mask) & self.geometry.board_mask
+
+    # list of the playable columns
+    def legal_moves(self):
+        return [j for j in range(self.geometry.columns) if self.can_play(j)]
+
+    # drops a piece of the current player into the column, returns the row (0 is the bottom)
+    def play(self, column):
+        bit = self.heights[column]
+        self.pieces[self.current_player - 1] |= 1 << bit
+        self.hash ^= self.geometry.zobrist[self.current_player - 1][bit]
+        self.mirror_hash ^= self.geometry.mirror_zobrist[self.current_player - 1][bit]
+        if self.evaluator is not None:
+            self.evaluator.push(bit, self.current_player)
+        self.heights[column] = bit + 1
+        self.history.append(column)
+        self.current_player = 3 - self.current_player
+        return bit - column * self.geometry.height
+
+    # takes back the last move
+    def undo(self):
+        column = self.history.pop()
+        bit = self.heights[column] - 1
+        self.heights[column] = bit
+        # the owner is looked up, positions built by from_array do not alternate in history order
+        player = 1 if self.pieces[0] >> bit & 1 else 2
+        self.pieces[player - 1] ^= 1 << bit
+        self.hash ^= self.geometry.zobrist[player - 1][bit]
+        self.mirror_hash ^= self.geometry.mirror_zobrist[player - 1][bit]
+        if self.evaluator is not None:
+            self.evaluator.pop(bit, player)
+        self.current_player = player
+        return column
+
+    # checks if the given player (1 or 2) has connect in a row
+    def has_won(self, player):
+        return self.geometry.is_win(self.pieces[player - 1])
+
+    # same meaning as Game.board_state (0 is draw, 1 is player1 won, 2 is player2 won, None is not finished)
+    def state(self):
+        if self.geometry.is_win(self.pieces[0]):
+            return 1
+        if self.geometry.is_win(self.pieces[1]):
+            return 2
+        if len(self.history) == self.geometry.size:
+            return 0
+        return None
+
+    # state after a piece was placed at column and row (0 is the bottom), the return value of play
+    # only the lines through that square are checked, so the position before the move must not be finished
+    def state_after(self, column, row):
+        bit = column * self.geometry.height + row
+        player = 1 if self.pieces[0] >> bit & 1 else 2
+        if is_win_at(self.pieces[player - 1], bit, self.geometry.line_masks):
+            return player
+        if len(self.history) == self.geometry.size:
+            return 0
+        return None
+
+    # converts to the array layout used by the renderer (row 0 is the top row, 1 is blue, 2 is red)
+    def to_array(self):
+        g = self.geometry
+        board = np.zeros((g.rows, g.columns))
+        for j in range(g.columns):
+            for r in range(self.heights[j] - j * g.height):
+                bit = 1 << (j * g.height + r)
+                board[g.rows - 1 - r][j] = 1 if self.pieces[0] & bit else 2
+        return board
+
+    # builds a position from the array layout, the player to move is derived from the piece count
+    # without a geometry the size comes from the array and four in a row wins
+    @staticmethod
+    def from_array(board, geometry=None):
+        board = np.asarray(board)
+        g = geometry or board_geometry(*board.shape)
+        position = Bitboard(g)
+        for j in range(g.columns):
+            for r in range(g.rows):
+                value = board[g.rows - 1 - r][j]
+                if value == 0:
+                    break
+                bit = j * g.height + r
+                position.pieces[int(value) - 1] |= 1 << bit
+                position.hash ^= g.zobrist[int(value) - 1][bit]
+                position.mirror_hash ^= g.mirror_zobrist[int(value) - 1][bit]
+                position.heights[j] = bit + 1
+        # the move order is unknown, so history only keeps the columns for undo
+        for j in range(g.columns):
+            position.history.extend([j] * (position.heights[j] - j * g.height))
+        if len(position.history) % 2 == 1:
+            position.current_player = 2
+        return position
+
+    def __repr__(self):
+        return 'Bitboard(' + ''.join(str(j + 1) for j in self.history) + ')'
+
+
+# position after the played columns counted from 1, a string like '4453' as in published benchmark sets
+# or a list of numbers, every move has to be playable and the game must not be over
+def position_from_moves(moves, geometry=STANDARD):
+    position = Bitboard(geometry)
+    for c in moves.strip() if isinstance(moves, str) else moves:
+        j = int(c) - 1
+        if not 0 <= j < geometry.columns or not position.can_play(j):
+            raise ValueError('invalid move {} in {}'.format(c, moves))
+        position.play(j)
+        if position.state() is not None:
+            raise ValueError('{} is already finished'.format(moves))
+    return position
+
+
+# plays random games on every geometry and compares state_after with the full board state after every move
+# and the mirror hash and canonical key of every game with the ones of the mirrored game
+def check_rules(games=1000, seed=0, geometries=None):
+    rng = random.Random(seed)
+    if geometries is None:
+        geometries = [STANDARD, board_geometry(7, 8), board_geometry(8, 9), board_geometry(7, 9, 5)]
+    for g in geometries:
+        for game in range(games):
+            position = Bitboard(g)
+            result = None
+            while result is None:
+                column = rng.choice(position.legal_moves())
+                row = position.play(column)
+                result = position.state_after(column, row)
+                if result != position.state():
+                    raise AssertionError('{} {!r}: state_after {} != state {}'.format(g, position, result,
+                                                                                     position.state()))
+                # the fixed four in a row check of the standard board
+                if g is STANDARD and (result in (1, 2)) != is_win(position.pieces[2 - position.current_player]):
+                    raise AssertionError('{!r}: is_win differs'.format(position))
+            # the mirrored game has the mirror hash and the same canonical key
+            mirror = Bitboard(g)
+            for column in position.history:
+                mirror.play(position.mirror_move(column))
+            if mirror.hash != position.mirror_hash or mirror.canonical_key()[0] != position.canonical_key()[0]:
+                raise AssertionError('{} {!r}: mirror differs'.format(g, position))
+    return True
+
+
+if __name__ == '__main__':
+    check_rules()
+    print('state_after agrees with the full board state, mirrored games agree')
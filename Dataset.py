@@ -0,0 +1,167 @@
+import argparse
+import glob
+import os
+import random
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Bitboard import random_opening
+from Game import Game
+
+# one labelled position: bitboard is (blue, red), side is the player to move (1 or 2)
+# score is the search value and outcome the final result (1 blue won, 0 draw, -1 red won), both seen from blue
+Sample = namedtuple('Sample', ['bitboard', 'side', 'score', 'outcome'])
+
+# record of a shard, 22 bytes per position
+DTYPE = np.dtype([('blue', '<u8'), ('red', '<u8'), ('side', 'i1'), ('score', '<f4'), ('outcome', 'i1')])
+
+# positions per shard file, also the most positions a writer keeps in memory
+SHARD_SIZE = 1 << 20
+
+# game of a worker process, kept between games so that its table is allocated only once
+_worker = None
+
+
+def _init_worker(depth):
+    global _worker
+    _worker = Game(depth, None)
+
+
+# plays one game with the play_ai_only logic and returns its searched positions as (blue, red, side, score, outcome)
+# the random opening moves are not searched and not part of the result
+def _play_game(seed, opening_plies):
+    game = _worker
+    game.initialize()
+    game.search.table.clear()
+    random_opening(game.position, opening_plies, random.Random(seed))
+
+    rows = []
+    result = game.board_state()
+    while result is None:
+        side = game.current_player
+        if side == 1:
+            (value, move) = game.max_player(-2, 2, game.search_depth)
+        else:
+            (value, move) = game.min_player(-2, 2, game.search_depth)
+        (blue, red) = game.position.pieces
+        rows.append((blue, red, side, value))
+        row = game.position.play(move)
+        result = game.move_state(move, row)
+
+    outcome = {1: 1, 2: -1, 0: 0}[result]
+    return [record + (outcome,) for record in rows]
+
+
+# yields the samples of games self play games lazily, one game after the other in seed order
+# at most a few games per worker are played ahead, so memory does not grow with the number of games
+def self_play(games, depth=5, opening_plies=4, workers=1, seed=0):
+    rng = random.Random(seed)
+    seeds = (rng.getrandbits(63) for game in range(games))
+    if workers <= 1:
+        _init_worker(depth)
+        for game_seed in seeds:
+            for (blue, red, side, score, outcome) in _play_game(game_seed, opening_plies):
+                yield Sample((blue, red), side, score, outcome)
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(depth,)) as executor:
+        pending = deque()
+        for game_seed in seeds:
+            pending.append(executor.submit(_play_game, game_seed, opening_plies))
+            if len(pending) < 4 * workers:
+                continue
+            for (blue, red, side, score, outcome) in pending.popleft().result():
+                yield Sample((blue, red), side, score, outcome)
+        while pending:
+            for (blue, red, side, score, outcome) in pending.popleft().result():
+                yield Sample((blue, red), side, score, outcome)
+
+
+def _shard_path(directory, index):
+    return os.path.join(directory, 'shard_{:05d}.npy'.format(index))
+
+
+# writes samples to numbered .npy shards of shard_size positions, returns the paths of the written shards
+def write_shards(samples, directory, shard_size=SHARD_SIZE):
+    os.makedirs(directory, exist_ok=True)
+    # readers take every shard of a directory, so the shards of two runs must not be mixed
+    if glob.glob(os.path.join(directory, 'shard_*.npy')):
+        raise FileExistsError('{} already contains shards'.format(directory))
+    paths = []
+    buffer = np.empty(shard_size, dtype=DTYPE)
+    n = 0
+    for sample in samples:
+        buffer[n] = (sample.bitboard[0], sample.bitboard[1], sample.side, sample.score, sample.outcome)
+        n += 1
+        if n == shard_size:
+            paths.append(_shard_path(directory, len(paths)))
+            np.save(paths[-1], buffer)
+            n = 0
+    if n:
+        paths.append(_shard_path(directory, len(paths)))
+        np.save(paths[-1], buffer[:n])
+    return paths
+
+
+# memory mapped shards of a directory in order, nothing is read until the arrays are used
+def read_shards(directory):
+    for path in sorted(glob.glob(os.path.join(directory, 'shard_*.npy'))):
+        yield np.load(path, mmap_mode='r')
+
+
+# streams the shards of a directory as arrays of at most chunk_size positions
+def iter_chunks(directory, chunk_size=1 << 16):
+    for shard in read_shards(directory):
+        for start in range(0, len(shard), chunk_size):
+            yield np.asarray(shard[start:start + chunk_size])
+
+
+# streams the shards of a directory back as samples
+def iter_samples(directory):
+    for chunk in iter_chunks(directory):
+        for record in chunk:
+            yield Sample((int(record['blue']), int(record['red'])), int(record['side']), float(record['score']),
+                         int(record['outcome']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='labelled positions from self play games')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help='play games and write the positions as .npy shards')
+    generate_parser.add_argument('--out', required=True, help='directory of the shards')
+    generate_parser.add_argument('--games', type=int, default=1000)
+    generate_parser.add_argument('--depth', type=int, default=5, help='search depth of the ai like Game --depth')
+    generate_parser.add_argument('--opening-plies', type=int, default=4, help='number of random opening moves')
+    generate_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    generate_parser.add_argument('--shard-size', type=int, default=SHARD_SIZE, help='positions per shard')
+    generate_parser.add_argument('--seed', type=int, default=0)
+    info_parser = commands.add_parser('info', help='count the positions and outcomes of a shard directory')
+    info_parser.add_argument('directory')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        if args.depth < 2:
+            parser.error('--depth has to be at least 2, the ai searches depth - 1 plies')
+        start = time.perf_counter()
+        samples = self_play(args.games, args.depth, args.opening_plies, args.workers, args.seed)
+        paths = write_shards(samples, args.out, args.shard_size)
+        elapsed = time.perf_counter() - start
+        positions = sum(len(shard) for shard in read_shards(args.out))
+        print('{} games, {} positions in {} shards, {:.1f} s ({:.0f} positions/s)'.format(
+            args.games, positions, len(paths), elapsed, positions / elapsed))
+    else:
+        positions = 0
+        outcomes = {1: 0, 0: 0, -1: 0}
+        for chunk in iter_chunks(args.directory):
+            positions += len(chunk)
+            for (outcome, count) in zip(*np.unique(chunk['outcome'], return_counts=True)):
+                outcomes[int(outcome)] += int(count)
+        print('{} positions, blue won {}, draws {}, red won {}'.format(positions, outcomes[1], outcomes[0],
+                                                                       outcomes[-1]))
+
+
+if __name__ == '__main__':
+    main()
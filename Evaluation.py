@@ -0,0 +1,245 @@
+import json
+import os
+import random
+
+import numpy as np
+
+from Bitboard import STANDARD, Bitboard
+
+
+# all windows of connect squares in the array layout (row 0 is the top row), in the order the old heuristic scanned them
+def _window_cells(rows, columns, connect):
+    n = connect - 1
+    windows = []
+    # rows
+    for i in range(rows):
+        for j in range(columns - n):
+            windows.append([(i, j + k) for k in range(connect)])
+    # columns
+    for i in range(rows - n):
+        for j in range(columns):
+            windows.append([(i + k, j) for k in range(connect)])
+    # diagonals
+    for i in range(rows - n):
+        for j in range(columns - n):
+            windows.append([(i + k, j + k) for k in range(connect)])
+    for i in range(n, rows):
+        for j in range(columns - n):
+            windows.append([(i - k, j + k) for k in range(connect)])
+    return windows
+
+
+# window tables of one board geometry, window_tables() builds them once per geometry
+class WindowTables:
+    def __init__(self, geometry):
+        rows = geometry.rows
+        height = geometry.height
+        connect = geometry.connect
+        self.cells = _window_cells(rows, geometry.columns, connect)
+        self.count = len(self.cells)
+        # bitboard mask of every window
+        self.masks = [sum(1 << (j * height + rows - 1 - i) for (i, j) in cells) for cells in self.cells]
+        # flat index into a (rows, columns) array for every square of every window, shape (count, connect)
+        self.index = np.array([[i * geometry.columns + j for (i, j) in cells] for cells in self.cells], dtype=np.intp)
+        # windows that contain a square, indexed by bit
+        self.cell_windows = [[] for bit in range(geometry.bits)]
+        for (w, cells) in enumerate(self.cells):
+            for (i, j) in cells:
+                self.cell_windows[j * height + rows - 1 - i].append(w)
+        # a window is stored as one code: number of blue pieces + red_code * number of red pieces
+        self.red_code = connect + 1
+        # possible lines and threats (one piece missing) of a window for blue minus the ones for red, indexed by code
+        self.possible = [0] * (self.red_code * self.red_code)
+        self.threats = [0] * (self.red_code * self.red_code)
+        for b in range(connect + 1):
+            for r in range(connect + 1 - b):
+                self.possible[b + self.red_code * r] = (r == 0) - (b == 0)
+                self.threats[b + self.red_code * r] = (b == connect - 1 and r == 0) - (r == connect - 1 and b == 0)
+
+
+_window_tables = {}
+
+
+def window_tables(geometry):
+    if geometry not in _window_tables:
+        _window_tables[geometry] = WindowTables(geometry)
+    return _window_tables[geometry]
+
+
+_STANDARD_TABLES = window_tables(STANDARD)
+
+# the tables of the standard board
+WINDOW_CELLS = _STANDARD_TABLES.cells
+WINDOW_COUNT = _STANDARD_TABLES.count
+WINDOW_MASKS = _STANDARD_TABLES.masks
+WINDOW_INDEX = _STANDARD_TABLES.index
+CELL_WINDOWS = _STANDARD_TABLES.cell_windows
+RED_CODE = _STANDARD_TABLES.red_code
+POSSIBLE = _STANDARD_TABLES.possible
+THREATS = _STANDARD_TABLES.threats
+
+
+# weights of the possible lines and the threats, Tuning.py writes fitted ones to WEIGHTS_PATH
+DEFAULT_WEIGHTS = (0.5, 0.5)
+WEIGHTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'weights.json')
+
+
+# (alpha, beta) from a json file like {"alpha": 0.5, "beta": 0.5}, the defaults if the file does not exist
+def load_weights(path=WEIGHTS_PATH):
+    if not os.path.exists(path):
+        return DEFAULT_WEIGHTS
+    with open(path) as f:
+        weights = json.load(f)
+    return float(weights['alpha']), float(weights['beta'])
+
+
+# combines the possible lines and threats (blue minus red) to the heuristic value, every evaluator ends here
+# count is the number of windows of the board
+def score(possible, threats, alpha, beta, count=WINDOW_COUNT):
+    return possible / count * alpha + threats / count * beta
+
+
+# counts possible lines and threats of a position with popcounts over the window masks
+def count_features(position):
+    tables = window_tables(position.geometry)
+    blue = position.pieces[0]
+    red = position.pieces[1]
+    possible = 0
+    threats = 0
+    for m in tables.masks:
+        code = (blue & m).bit_count() + tables.red_code * (red & m).bit_count()
+        possible += tables.possible[code]
+        threats += tables.threats[code]
+    return possible, threats
+
+
+# heuristic value of a position without incremental state
+def evaluate(position, alpha, beta):
+    return score(*count_features(position), alpha, beta, window_tables(position.geometry).count)
+
+
+# heuristic value of a board in the array layout with one numpy reduction over the window index
+def evaluate_array(board, alpha, beta):
+    windows = np.asarray(board).reshape(-1)[WINDOW_INDEX]
+    blue = (windows == 1).sum(axis=1)
+    red = (windows == 2).sum(axis=1)
+    possible = int((red == 0).sum()) - int((blue == 0).sum())
+    threats = int(((blue == 3) & (red == 0)).sum()) - int(((red == 3) & (blue == 0)).sum())
+    return score(possible, threats, alpha, beta)
+
+
+# the old scalar heuristic with the threat check fixed to count three own pieces and one empty square
+def reference_heuristic(board, alpha, beta):
+    number_possible_blue = 0
+    number_possible_red = 0
+    number_threats_blue = 0
+    number_threats_red = 0
+    for cells in WINDOW_CELLS:
+        values = [board[i][j] for (i, j) in cells]
+        if 2 not in values:
+            number_possible_blue += 1
+        if 1 not in values:
+            number_possible_red += 1
+        if values.count(1) == 3 and values.count(0) == 1:
+            number_threats_blue += 1
+        if values.count(2) == 3 and values.count(0) == 1:
+            number_threats_red += 1
+    return score(number_possible_blue - number_possible_red, number_threats_blue - number_threats_red, alpha, beta)
+
+
+# keeps the window codes of a position and updates the heuristic on every play and undo of the position
+class Evaluator:
+    def __init__(self, alpha, beta):
+        self.alpha = alpha
+        self.beta = beta
+        self.use_tables(_STANDARD_TABLES)
+
+    # the window tables of the board the evaluator counts on
+    def use_tables(self, tables):
+        self.count = tables.count
+        self.cell_windows = tables.cell_windows
+        self.red_code = tables.red_code
+        self.possible_codes = tables.possible
+        self.threat_codes = tables.threats
+        self.codes = [0] * tables.count
+        self.possible = 0
+        self.threats = 0
+
+    # connects the evaluator to the position and counts its pieces once
+    def attach(self, position):
+        position.evaluator = self
+        self.use_tables(window_tables(position.geometry))
+        for player in (1, 2):
+            pieces = position.pieces[player - 1]
+            for bit in range(position.geometry.bits):
+                if pieces >> bit & 1:
+                    self.push(bit, player)
+
+    # a piece of the player was placed on the bit
+    def push(self, bit, player):
+        add = 1 if player == 1 else self.red_code
+        codes = self.codes
+        possible_codes = self.possible_codes
+        threat_codes = self.threat_codes
+        possible = self.possible
+        threats = self.threats
+        for w in self.cell_windows[bit]:
+            code = codes[w]
+            new = code + add
+            codes[w] = new
+            possible += possible_codes[new] - possible_codes[code]
+            threats += threat_codes[new] - threat_codes[code]
+        self.possible = possible
+        self.threats = threats
+
+    # the piece of the player on the bit was taken back
+    def pop(self, bit, player):
+        add = 1 if player == 1 else self.red_code
+        codes = self.codes
+        possible_codes = self.possible_codes
+        threat_codes = self.threat_codes
+        possible = self.possible
+        threats = self.threats
+        for w in self.cell_windows[bit]:
+            code = codes[w]
+            new = code - add
+            codes[w] = new
+            possible += possible_codes[new] - possible_codes[code]
+            threats += threat_codes[new] - threat_codes[code]
+        self.possible = possible
+        self.threats = threats
+
+    # heuristic value of the attached position for player 1
+    def value(self):
+        return score(self.possible, self.threats, self.alpha, self.beta, self.count)
+
+
+# plays random games and checks that all evaluators agree exactly with the reference after every play and undo
+def check_parity(games=200, seed=0, alpha=0.5, beta=0.5):
+    rng = random.Random(seed)
+    evaluator = Evaluator(alpha, beta)
+    for game in range(games):
+        position = Bitboard()
+        evaluator.attach(position)
+        values = []
+        while position.state() is None:
+            position.play(rng.choice(position.legal_moves()))
+            board = position.to_array()
+            expected = reference_heuristic(board.tolist(), alpha, beta)
+            for value in (evaluator.value(), evaluate(position, alpha, beta), evaluate_array(board, alpha, beta)):
+                if value != expected:
+                    raise AssertionError('{!r}: {!r} != {!r}'.format(position, value, expected))
+            values.append(expected)
+        # undo has to restore the same values in reverse order
+        while position.history:
+            if evaluator.value() != values.pop():
+                raise AssertionError('{!r}: wrong value after undo'.format(position))
+            position.undo()
+        if evaluator.possible != 0 or evaluator.threats != 0:
+            raise AssertionError('empty board after undo is not zero')
+    return True
+
+
+if __name__ == '__main__':
+    check_parity()
+    print('all evaluators agree with the reference heuristic')
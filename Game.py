@@ -1,7 +1,16 @@
-import numpy as np
-import pygame
+import argparse
+import random
+import sys
+import threading
 import time
 
+from Bitboard import STANDARD, Bitboard, board_geometry, random_opening
+from Evaluation import Evaluator, load_weights, score
+from Instrumentation import SearchStats, profile
+from OpeningBook import OpeningBook
+from Search import Search, SearchTimeout
+from TranspositionTable import TranspositionTable
+
 # used colors
 RED = (255, 0, 0)
 BLUE = (0, 0, 255)
@@ -13,105 +22,146 @@ YELLOW = (255, 255, 0)
 SQUARE_SIZE = 100
 CIRCLE_SIZE = int(SQUARE_SIZE / 2 - 1)
 
-# search depth of the minimax algorithm
+# search depth of the minimax algorithm, only used when MOVE_TIME is None
 SEARCH_DEPTH = 5
 
-# alpha and beta are the parameters for the weighting of the heuristic
-ALPHA = 0.5
-BETA = 0.5
+# time budget of the ai per move in milliseconds, the search deepens one ply at a time until it is used up
+MOVE_TIME = 500
+
+# modes that can be chosen in the window or on the command line
+PLAYER_COLORS = ('blue', 'red', 'ai_vs_ai', 'pvp')
+
+# alpha and beta are the parameters for the weighting of the heuristic, tuned ones are read from weights.json
+(ALPHA, BETA) = load_weights()
+
+# memory cap of the transposition table of the ai in megabytes
+TABLE_SIZE_MB = 16
 
 
 class Game:
-    def __init__(self):
-        self.board = []
-        self.current_player = None
+    def __init__(self, search_depth=SEARCH_DEPTH, move_time=MOVE_TIME, book=None, geometry=STANDARD):
+        # board size and win length, Bitboard.board_geometry
+        self.geometry = geometry
+        self.search_depth = search_depth
+        self.move_time = move_time
+        # optional OpeningBook, its moves are played without a search
+        self.book = book
+        self.position = None
         self.screen = None
         self.game_running = None
-        self.clock = None
+        # second game that searches the ai moves of the window in the background
+        self.worker = None
+        # search the replies to the likely human moves while the human thinks
+        self.ponder = False
         self.player_color = None
+        self.last_result = None
+        self.evaluator = Evaluator(ALPHA, BETA)
+        self.search = Search(self.evaluate, TranspositionTable(TABLE_SIZE_MB))
         self.initialize()
 
-    # initialize the board as a list of zeros
+    # initialize the board as an empty bitboard, player 1 starts
     def initialize(self):
-        self.board = np.zeros((6, 7))
-        # player 1 starts
-        self.current_player = 1
+        self.set_position(Bitboard(self.geometry))
+
+    # replaces the position, the evaluator follows it from now on
+    def set_position(self, position):
+        self.position = position
+        self.evaluator.attach(position)
+
+    # the board as an array of zeros, ones and twos for drawing and printing
+    @property
+    def board(self):
+        return self.position.to_array()
+
+    @board.setter
+    def board(self, board):
+        self.set_position(Bitboard.from_array(board, self.geometry))
+
+    @property
+    def current_player(self):
+        return self.position.current_player
+
+    @current_player.setter
+    def current_player(self, player):
+        self.position.current_player = player
 
     # switch the current player
     def switch_player(self):
-        if self.current_player == 1:
-            self.current_player = 2
-        else:
-            self.current_player = 1
+        self.position.current_player = 3 - self.position.current_player
 
-    # gives the current state of the board (0 is draw, 1 is player1 won, -1 is player2 won, None is not finished)
+    # gives the current state of the board (0 is draw, 1 is player1 won, 2 is player2 won, None is not finished)
     def board_state(self):
-        # check rows for wins
-        for i in range(6):
-            for j in range(4):
-                if self.board[i][j] == self.board[i][j + 1] == self.board[i][j + 2] == self.board[i][j + 3] != 0:
-                    return self.board[i][j]
-
-        # check columns for wins
-        for i in range(3):
-            for j in range(7):
-                if self.board[i][j] == self.board[i + 1][j] == self.board[i + 2][j] == self.board[i + 3][j] != 0:
-                    return self.board[i][j]
-
-        # check diagonals for wins
-        for i in range(3):
-            for j in range(4):
-                if self.board[i][j] == self.board[i + 1][j + 1] == self.board[i + 2][j + 2] == \
-                        self.board[i + 3][j + 3] != 0:
-                    return self.board[i][j]
-
-        for i in range(3, 6):
-            for j in range(4):
-                if self.board[i][j] == self.board[i - 1][j + 1] == self.board[i - 2][j + 2] == \
-                        self.board[i - 3][j + 3] != 0:
-                    return self.board[i][j]
-
-        # check for draw
-        for i in range(6):
-            for j in range(7):
-                if self.board[i][j] == 0:
-                    return None
-        return 0
+        return self.position.state()
+
+    # same meaning as board_state after a piece was placed at column and row, only checks the lines through it
+    # board_state scans the whole board and stays for positions whose last move is unknown
+    def move_state(self, column, row):
+        return self.position.state_after(column, row)
 
     # shows the current state of the board
     def show_board(self):
         print(self.board)
 
-    # draw the board
-    def draw_board(self):
-        for i in range(6):
-            for j in range(7):
-                pygame.draw.rect(self.screen, (255, 255, 0),
+    # draw the grid onto the surface, it does not change during a game and is drawn only once
+    def draw_board(self, surface):
+        import pygame
+
+        for i in range(self.geometry.rows):
+            for j in range(self.geometry.columns):
+                pygame.draw.rect(surface, (255, 255, 0),
                                  (SQUARE_SIZE * j, SQUARE_SIZE * i, SQUARE_SIZE, SQUARE_SIZE))
-                pygame.draw.line(self.screen, (0, 0, 0), (SQUARE_SIZE * j, SQUARE_SIZE * i),
+                pygame.draw.line(surface, (0, 0, 0), (SQUARE_SIZE * j, SQUARE_SIZE * i),
                                  (SQUARE_SIZE * (j + 1), SQUARE_SIZE * i))
-                pygame.draw.line(self.screen, (0, 0, 0), (SQUARE_SIZE * j, SQUARE_SIZE * i),
+                pygame.draw.line(surface, (0, 0, 0), (SQUARE_SIZE * j, SQUARE_SIZE * i),
                                  (SQUARE_SIZE * j, SQUARE_SIZE * (i + 1)))
 
+    # draw one column from the cached grid and its pieces, returns the changed part of the window
+    def draw_column(self, grid, j):
+        import pygame
+
+        rect = pygame.Rect(SQUARE_SIZE * j, 0, SQUARE_SIZE, SQUARE_SIZE * self.geometry.rows)
+        self.screen.blit(grid, rect, rect)
+        board = self.board
+        for i in range(self.geometry.rows):
+            if board[i][j] == 1:
+                pygame.draw.circle(self.screen, BLUE, (SQUARE_SIZE * j + 50, SQUARE_SIZE * i + 50), CIRCLE_SIZE)
+            elif board[i][j] == 2:
+                pygame.draw.circle(self.screen, RED, (SQUARE_SIZE * j + 50, SQUARE_SIZE * i + 50), CIRCLE_SIZE)
+        return rect
+
+    # checks if the player to move is a human
+    def human_turn(self):
+        return (self.player_color == 'blue' and self.current_player == 1) \
+            or (self.player_color == 'red' and self.current_player == 2) \
+            or (self.player_color == 'pvp')
+
+    # searches the ai move on a copy of the position in a background thread and posts it as a pygame event
+    def start_ai_move(self, event_type):
+        import pygame
+
+        worker = self.worker
+        worker.set_position(self.position.copy())
+
+        def run():
+            try:
+                move = worker.ai_move()
+                pygame.event.post(pygame.event.Event(event_type, column=move))
+            except (SearchTimeout, pygame.error):
+                # the search was stopped or the window is already closed
+                pass
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
     # starts the game ai vs ai without pygame, returns the winner
     def play_ai_only(self):
         while True:
-            if self.current_player == 1:
-                (placeholder, key_pressed) = self.max_player(ALPHA, BETA, SEARCH_DEPTH)
-
-            else:
-                (placeholder, key_pressed) = self.min_player(ALPHA, BETA, SEARCH_DEPTH)
-
-            x_pos = None
-            for i in range(5, -1, -1):
-                if self.board[i][key_pressed] == 0:
-                    x_pos = i
-                    break
-            self.board[x_pos][key_pressed] = self.current_player
-            self.switch_player()
+            key_pressed = self.ai_move()
+            row = self.position.play(key_pressed)
 
             # check if the game is over
-            result = self.board_state()
+            result = self.move_state(key_pressed, row)
             if result == 1:
                 print('Player 1 has won the game! ')
                 return result
@@ -122,132 +172,119 @@ class Game:
                 print('The game ended in a draw! ')
                 return result
 
-    # starts and plays the game
+    # starts and plays the game, the window only redraws after events and the ai searches in the background
     def play_pygame(self):
+        # pygame is only loaded when the window is opened, the engine works without it
+        import pygame
+
         # pygame initialization
         pygame.init()
-        self.screen = pygame.display.set_mode((700, 600))
-        pygame.display.set_caption("connect 4")
+        size = (SQUARE_SIZE * self.geometry.columns, SQUARE_SIZE * self.geometry.rows)
+        self.screen = pygame.display.set_mode(size)
+        pygame.display.set_caption("connect {}".format(self.geometry.connect))
         self.game_running = True
-        self.clock = pygame.time.Clock()
 
         text = ''
-        done = False
 
         font = pygame.font.SysFont('Comic Sans MS', 50)
         font_explanation = pygame.font.SysFont('Comic Sans MS', 20)
 
-        self.screen.fill((255, 255, 255))
-
-        # choose playing side
-        while True:
-            while not done:
-
-                text_surface = font.render(text, False, (0, 0, 0))
-                text_surface_explanation = font_explanation.render(
-                    'Please type blue, red, ai_vs_ai or pvp and press enter to start the game. ', False, (0, 0, 0))
-                self.screen.blit(text_surface, (100, 200))
-                self.screen.blit(text_surface_explanation, (10, 50))
-
-                pygame.display.update()
-
-                for event in pygame.event.get():
-                    if event.type == pygame.KEYDOWN:
-                        if event.key == pygame.K_RETURN:
-                            done = True
-                            self.player_color = text
-                            text = ''
-                        elif event.key == pygame.K_BACKSPACE:
-                            text = text[:-1]
-                        else:
-                            text += event.unicode
-
-            done = False
-            if self.player_color == 'blue' or self.player_color == 'red' \
-                    or self.player_color == 'ai_vs_ai' or self.player_color == 'pvp':
-                break
+        # choose playing side, unless it was given on the command line
+        while self.player_color not in PLAYER_COLORS:
+            self.screen.fill((255, 255, 255))
+            text_surface = font.render(text, False, (0, 0, 0))
+            text_surface_explanation = font_explanation.render(
+                'Please type blue, red, ai_vs_ai or pvp and press enter to start the game. ', False, (0, 0, 0))
+            self.screen.blit(text_surface, (100, 200))
+            self.screen.blit(text_surface_explanation, (10, 50))
+            pygame.display.update()
+
+            event = pygame.event.wait()
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                return
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RETURN:
+                    self.player_color = text
+                    text = ''
+                elif event.key == pygame.K_BACKSPACE:
+                    text = text[:-1]
+                else:
+                    text += event.unicode
 
         # choose only ai player for alpha, beta learning
         # self.player_color = 'ai_vs_ai'
 
-        result = None
-
-        while self.game_running:
-            # check for user interaction
-            key_pressed = None
-
-            if (self.player_color == 'blue' and self.current_player == 1) \
-                    or (self.player_color == 'red' and self.current_player == 2) \
-                    or (self.player_color == 'pvp'):
-
-                for event in pygame.event.get():
-
-                    # exit game when quit is pressed
-                    if event.type == pygame.QUIT:
-                        self.game_running = False
-
-                    # if a number between 1 and 7 is pressed, save it
-                    elif event.type == pygame.KEYDOWN and (event.key == pygame.K_1 or event.key == pygame.K_KP1):
-                        key_pressed = 1
-                    elif event.type == pygame.KEYDOWN and (event.key == pygame.K_2 or event.key == pygame.K_KP2):
-                        key_pressed = 2
-                    elif event.type == pygame.KEYDOWN and (event.key == pygame.K_3 or event.key == pygame.K_KP3):
-                        key_pressed = 3
-                    elif event.type == pygame.KEYDOWN and (event.key == pygame.K_4 or event.key == pygame.K_KP4):
-                        key_pressed = 4
-                    elif event.type == pygame.KEYDOWN and (event.key == pygame.K_5 or event.key == pygame.K_KP5):
-                        key_pressed = 5
-                    elif event.type == pygame.KEYDOWN and (event.key == pygame.K_6 or event.key == pygame.K_KP6):
-                        key_pressed = 6
-                    elif event.type == pygame.KEYDOWN and (event.key == pygame.K_7 or event.key == pygame.K_KP7):
-                        key_pressed = 7
-
-            elif self.current_player == 1:
-                (placeholder, key_pressed) = self.max_player(-2, 2, SEARCH_DEPTH)
-                key_pressed += 1
+        # keys 1 to 9 select a column
+        column_keys = {}
+        for j in range(min(self.geometry.columns, 9)):
+            column_keys[getattr(pygame, 'K_' + str(j + 1))] = j
+            column_keys[getattr(pygame, 'K_KP' + str(j + 1))] = j
+        ai_move_event = pygame.USEREVENT + 1
+
+        # the ai searches with its own game, so the shown position never changes during a search
+        self.worker = Game(self.search_depth, self.move_time, self.book, self.geometry)
+        self.worker.search.stats = self.search.stats
+        thinking = None
+        pondering = None
+
+        # the grid is drawn once, afterwards only changed columns are copied from it
+        grid = pygame.Surface(size)
+        self.draw_board(grid)
+        self.screen.blit(grid, (0, 0))
+        for j in range(self.geometry.columns):
+            self.draw_column(grid, j)
+        pygame.display.flip()
 
-            else:
-                (placeholder, key_pressed) = self.min_player(-2, 2, SEARCH_DEPTH)
-                key_pressed += 1
-
-            # calculate game logic
-            if key_pressed is not None and self.board[0][key_pressed - 1] != 0:
-                key_pressed = None
-
-            if key_pressed is not None:
-                key_pressed -= 1
-                x_pos = None
-                for i in range(5, -1, -1):
-                    if self.board[i][key_pressed] == 0:
-                        x_pos = i
-                        break
-                self.board[x_pos][key_pressed] = self.current_player
-                self.switch_player()
-
-            # delete board
-            self.screen.fill((40, 40, 40))
-
-            # draw board and pieces
-            self.draw_board()
-            for i in range(6):
-                for j in range(7):
-                    if self.board[i][j] == 1:
-                        pygame.draw.circle(self.screen, BLUE, (SQUARE_SIZE * j + 50, SQUARE_SIZE * i + 50), CIRCLE_SIZE)
-
-                    elif self.board[i][j] == 2:
-                        pygame.draw.circle(self.screen, RED, (SQUARE_SIZE * j + 50, SQUARE_SIZE * i + 50), CIRCLE_SIZE)
-
-            # refresh window
-            pygame.display.flip()
-
-            # set refresh timer
-            self.clock.tick(60)
-
-            # check if game is over
-            result = self.board_state()
-
-            if result is not None:
-                break
+        result = self.board_state()
+
+        while self.game_running and result is None:
+            if thinking is None and not self.human_turn():
+                thinking = self.start_ai_move(ai_move_event)
+            elif self.ponder and thinking is None and pondering is None and self.player_color in ('blue', 'red'):
+                pondering = Ponder(self.worker, self.position, ai_move_event)
+
+            # sleep until something happens
+            event = pygame.event.wait()
+            column = None
+
+            # exit game when quit is pressed
+            if event.type == pygame.QUIT:
+                self.game_running = False
+
+            # if a number between 1 and 7 is pressed, save it
+            elif event.type == pygame.KEYDOWN and thinking is None and self.human_turn():
+                column = column_keys.get(event.key)
+
+            elif event.type == ai_move_event:
+                thinking = None
+                column = event.column
+
+            # the window was covered or restored
+            elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                self.screen.blit(grid, (0, 0))
+                for j in range(self.geometry.columns):
+                    self.draw_column(grid, j)
+                pygame.display.flip()
+
+            # calculate game logic and redraw only the changed column
+            if column is not None and self.position.can_play(column):
+                row = self.position.play(column)
+                pygame.display.update(self.draw_column(grid, column))
+
+                # check if game is over
+                result = self.move_state(column, row)
+
+                # the human moved, the reply may already be searched
+                if pondering is not None:
+                    if pondering.resolve(column if result is None else None):
+                        thinking = pondering
+                    pondering = None
+
+        if pondering is not None:
+            pondering.cancel()
+        if thinking is not None:
+            self.worker.search.stop()
 
         if result == 1:
             text_surface = font.render('Blue has won the game. ', False, (0, 0, 0))
@@ -261,17 +298,38 @@ class Game:
 
         pygame.display.flip()
 
-        time.sleep(5)
+        # show the result for 5 seconds unless the window is closed
+        end = time.time() + 5
+        while self.game_running and time.time() < end:
+            if pygame.event.wait(int((end - time.time()) * 1000) + 1).type == pygame.QUIT:
+                break
 
         pygame.quit()
 
-    # the maximizing part of the ai
-    def max_player(self, alpha, beta, depth):
-        # here the best found value for the moves is saved, starting with a value worse than every move possible
-        best_value = -2
-        # here the best found move is saved
-        best_move = None
+    # chooses the column of the ai for the current player
+    def ai_move(self, verbose=True):
+        if self.book is not None:
+            entry = self.book.lookup(self.position)
+            if entry is not None:
+                if verbose:
+                    print('ai move {}: opening book'.format(entry.move + 1))
+                return entry.move
 
+        if self.move_time is None:
+            if self.current_player == 1:
+                (placeholder, move) = self.max_player(-2, 2, self.search_depth)
+            else:
+                (placeholder, move) = self.min_player(-2, 2, self.search_depth)
+            return move
+
+        self.last_result = self.search.think(self.position, self.move_time)
+        if verbose:
+            print('ai move {}: depth {}, {} nodes, {:.0f} ms'.format(
+                self.last_result.move + 1, self.last_result.depth, self.last_result.nodes, self.last_result.time))
+        return self.last_result.move
+
+    # the maximizing part of the ai, alpha and beta are the search window and not the heuristic weights
+    def max_player(self, alpha, beta, depth):
         # if the game is over return the result
         result = self.board_state()
         if result is not None:
@@ -280,46 +338,13 @@ class Game:
             else:
                 return result, 0
 
-        # if the depth limit is reached return heuristic
-        depth -= 1
-        if depth <= 0:
-            return self.heuristic(alpha, beta)
-
-        # select every possible move once
-        for j in range(7):
-            # check if the column has a free square to select
-            if self.board[0][j] == 0:
-                # set the selected square to the ai´s color
-                x_pos = None
-                for i in range(5, -1, -1):
-                    if self.board[i][j] == 0:
-                        x_pos = i
-                        break
-                self.board[x_pos][j] = 1
-
-                (found_result, placeholder) = self.min_player(alpha, beta, depth)
-
-                self.board[x_pos][j] = 0
-
-                if found_result > best_value:
-                    best_value = found_result
-                    best_move = j
-
-                # if best_value >= beta:
-                #    return best_value, best_move
-
-                # if best_value > alpha:
-                #    alpha = best_value
+        # the root always searches one ply, so that a move is returned even for the smallest depths
+        depth = max(depth - 1, 1)
+        self.position.current_player = 1
+        return self.search.iterate(self.position, depth, alpha, beta)
 
-        return best_value, best_move
-
-    # the minimizing part of the ai
+    # the minimizing part of the ai, the negamax search sees the values from red, so the window is mirrored
     def min_player(self, alpha, beta, depth):
-        # here the best found value for the moves is saved, starting with a value worse than every move possible
-        best_value = 2
-        # here the best found move is saved
-        best_move = None
-
         # if the game is over return the result
         result = self.board_state()
         if result is not None:
@@ -328,204 +353,158 @@ class Game:
             else:
                 return result, 0
 
-        # if the depth limit is reached return heuristic
-        depth -= 1
-        if depth <= 0:
-            return self.heuristic(alpha, beta)
-
-        # select every possible move once
-        for j in range(7):
-            # check if the column has a free square to select
-            if self.board[0][j] == 0:
-                # set the selected square to the ai´s color
-                x_pos = None
-                for i in range(5, -1, -1):
-                    if self.board[i][j] == 0:
-                        x_pos = i
-                        break
-                self.board[x_pos][j] = 2
-
-                (found_result, placeholder) = self.max_player(alpha, beta, depth)
-
-                self.board[x_pos][j] = 0
-
-                if found_result < best_value:
-                    best_value = found_result
-                    best_move = j
+        # the root always searches one ply, so that a move is returned even for the smallest depths
+        depth = max(depth - 1, 1)
+        self.position.current_player = 2
+        (value, best_move) = self.search.iterate(self.position, depth, -beta, -alpha)
+        return -value, best_move
 
-                # if best_value <= alpha:
-                #    return best_value, best_move
-
-                # if best_value < beta:
-                #    alpha = best_value
-
-        return best_value, best_move
+    # heuristic value of the current position for the search, seen from player 1
+    def evaluate(self, position):
+        return self.evaluator.value()
 
+    # alpha and beta are the weights of the possible lines and the threats
+    # the caller checks board_state first, the evaluator keeps the counts up to date on every move
     def heuristic(self, alpha, beta):
-
-        # value is the calculated value of the current game state
-        value = None
-
-        value = self.board_state()
-        if value is not None:
-            if value == 2:
-                return -1, 0
-            else:
-                return value, 0
-
-        else:
-            # idea 1: count number of possible 4 in a row still possible
-            # idea 2: count number of threats (one more tile needed for 4)
-
-            # number of possible 4 in a row for blue
-            number_possible_blue = 0
-            # check rows for wins
-            for i in range(6):
-                for j in range(4):
-                    if self.board[i][j] != 2 and self.board[i][j + 1] != 2 and \
-                            self.board[i][j + 2] != 2 and self.board[i][j + 3] != 2:
-                        number_possible_blue += 1
-
-            # check columns for wins
-            for i in range(3):
-                for j in range(7):
-                    if self.board[i][j] != 2 and self.board[i + 1][j] != 2 \
-                            and self.board[i + 2][j] != 2 and self.board[i + 3][j] != 2:
-                        number_possible_blue += 1
-
-            # check diagonals for wins
-            for i in range(3):
-                for j in range(4):
-                    if self.board[i][j] != 2 and self.board[i + 1][j + 1] != 2 \
-                            and self.board[i + 2][j + 2] != 2 and self.board[i + 3][j + 3] != 2:
-                        number_possible_blue += 1
-
-            for i in range(3, 6):
-                for j in range(4):
-                    if self.board[i][j] != 2 and self.board[i - 1][j + 1] != 2 \
-                            and self.board[i - 2][j + 2] != 2 and self.board[i - 3][j + 3] != 2:
-                        number_possible_blue += 1
-
-            # number of possible 4 in a row for red
-            number_possible_red = 0
-            # check rows for wins
-            for i in range(6):
-                for j in range(4):
-                    if self.board[i][j] != 1 and self.board[i][j + 1] != 1 \
-                            and self.board[i][j + 2] != 1 and self.board[i][j + 3] != 1:
-                        number_possible_red += 1
-
-            # check columns for wins
-            for i in range(3):
-                for j in range(7):
-                    if self.board[i][j] != 1 and self.board[i + 1][j] != 1 \
-                            and self.board[i + 2][j] != 1 and self.board[i + 3][j] != 1:
-                        number_possible_red += 1
-
-            # check diagonals for wins
-            for i in range(3):
-                for j in range(4):
-                    if self.board[i][j] != 1 and self.board[i + 1][j + 1] != 1 \
-                            and self.board[i + 2][j + 2] != 1 and self.board[i + 3][j + 3] != 1:
-                        number_possible_red += 1
-
-            for i in range(3, 6):
-                for j in range(4):
-                    if self.board[i][j] != 1 and self.board[i - 1][j + 1] != 1 \
-                            and self.board[i - 2][j + 2] != 1 and self.board[i - 3][j + 3] != 1:
-                        number_possible_red += 1
-
-            # possible_score has a value between 69 and -69
-            possible_score = number_possible_blue - number_possible_red
-            # get possible_score to a range from -1 to 1
-            possible_score = possible_score / 69
-
-            # number of threats from blue
-            number_threats_blue = 0
-            # check rows for threats
-            for i in range(6):
-                for j in range(4):
-                    if (self.board[i][j] == 1 + self.board[i][j + 1] == 1 + self.board[i][j + 2] == 1 +
-                            self.board[i][j + 3] == 1) == 3:
-                        if self.board[i][j] == 0 or self.board[i][j + 1] == 0 or \
-                                self.board[i][j + 2] == 0 or self.board[i][j + 3] == 0:
-                            number_threats_blue += 1
-
-            # check columns for threats
-            for i in range(3):
-                for j in range(7):
-                    if (self.board[i][j] == 1 + self.board[i + 1][j] == 1 + self.board[i + 2][j] == 1 +
-                            self.board[i + 3][j] == 1) == 3:
-                        if self.board[i][j] == 0 or self.board[i + 1][j] == 0 or \
-                                self.board[i + 2][j] == 0 or self.board[i + 3][j] == 0:
-                            number_threats_blue += 1
-
-            # check diagonals for threats
-            for i in range(3):
-                for j in range(4):
-                    if (self.board[i][j] == 1 + self.board[i + 1][j + 1] == 1 + self.board[i + 2][j + 2] == 1 +
-                            self.board[i + 3][j + 3] == 1) == 3:
-                        if self.board[i][j] == 0 or self.board[i + 1][j + 1] == 0 or \
-                                self.board[i + 2][j + 2] == 0 or self.board[i + 3][j + 3] == 0:
-                            number_threats_blue += 1
-
-            for i in range(3, 6):
-                for j in range(4):
-                    if (self.board[i][j] == 1 + self.board[i - 1][j + 1] == 1 + self.board[i - 2][j + 2] == 1 +
-                            self.board[i - 3][j + 3] == 1) == 3:
-                        if self.board[i][j] == 0 or self.board[i - 1][j + 1] == 0 or \
-                                self.board[i - 2][j + 2] == 0 or self.board[i - 3][j + 3] == 0:
-                            number_threats_blue += 1
-
-            # number of threats from red
-            number_threats_red = 0
-            # check rows for threats
-            for i in range(6):
-                for j in range(4):
-                    if (self.board[i][j] == 2 + self.board[i][j + 1] == 2 + self.board[i][j + 2] == 2 +
-                            self.board[i][j + 3] == 2) == 3:
-                        if self.board[i][j] == 0 or self.board[i][j + 1] == 0 or \
-                                self.board[i][j + 2] == 0 or self.board[i][j + 3] == 0:
-                            number_threats_red += 1
-
-            # check columns for threats
-            for i in range(3):
-                for j in range(7):
-                    if (self.board[i][j] == 2 + self.board[i + 1][j] == 2 + self.board[i + 2][j] == 2 +
-                            self.board[i + 3][j] == 2) == 3:
-                        if self.board[i][j] == 0 or self.board[i + 1][j] == 0 or \
-                                self.board[i + 2][j] == 0 or self.board[i + 3][j] == 0:
-                            number_threats_red += 1
-
-            # check diagonals for threats
-            for i in range(3):
-                for j in range(4):
-                    if (self.board[i][j] == 2 + self.board[i + 1][j + 1] == 2 + self.board[i + 2][j + 2] == 2 +
-                            self.board[i + 3][j + 3] == 2) == 3:
-                        if self.board[i][j] == 0 or self.board[i + 1][j + 1] == 0 or \
-                                self.board[i + 2][j + 2] == 0 or self.board[i + 3][j + 3] == 0:
-                            number_threats_red += 1
-
-            for i in range(3, 6):
-                for j in range(4):
-                    if (self.board[i][j] == 2 + self.board[i - 1][j + 1] == 2 + self.board[i - 2][j + 2] == 2 +
-                            self.board[i - 3][j + 3] == 2) == 3:
-                        if self.board[i][j] == 0 or self.board[i - 1][j + 1] == 0 or \
-                                self.board[i - 2][j + 2] == 0 or self.board[i - 3][j + 3] == 0:
-                            number_threats_red += 1
-
-            # threats_score between 69 and -69
-            threats_score = number_threats_blue - number_threats_red
-            # get threats_score to be between -1 and 1
-            threats_score = threats_score / 69
-
-            return possible_score * 0.5 + threats_score * 0.5, 0
-
-
-def test():
-    test1 = Game()
-    # game = test1.play_ai_only()
-    test1.play_pygame()
-
-
-test()
+        return score(self.evaluator.possible, self.evaluator.threats, alpha, beta, self.evaluator.count), 0
+
+
+# searches the ai replies to the human moves of a position in a background thread, the likely move first
+# the reply to the move the human plays is posted as event_type, the other searches are stopped
+class Ponder:
+    def __init__(self, worker, position, event_type):
+        # the Game that searches, it is not used by anything else until resolve or cancel returns
+        self.worker = worker
+        self.position = position.copy()
+        self.event_type = event_type
+        # ai replies to the human moves that are searched already
+        self.replies = {}
+        # human move that is searched right now
+        self.current = None
+        # move the human played, set by resolve
+        self.played = None
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+        # the last search of the worker left the expected human move in its table
+        likely = worker.search.table_move(self.position)
+        self.moves = [j for j in position.geometry.center_order if j != likely and position.can_play(j)]
+        if likely is not None:
+            self.moves.insert(0, likely)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        for move in self.moves:
+            position = self.position.copy()
+            row = position.play(move)
+            if position.state_after(move, row) is not None:
+                continue
+            with self.lock:
+                if self.cancelled or self.played is not None:
+                    return
+                self.current = move
+            self.worker.set_position(position)
+            try:
+                reply = self.worker.ai_move(verbose=False)
+            except SearchTimeout:
+                return
+            with self.lock:
+                if self.cancelled:
+                    return
+                self.replies[move] = reply
+                self.current = None
+                if self.played == move:
+                    self.post(reply)
+                    return
+
+    def post(self, reply):
+        import pygame
+
+        print('ai move {}: pondered'.format(reply + 1))
+        try:
+            pygame.event.post(pygame.event.Event(self.event_type, column=reply))
+        except pygame.error:
+            # the window is already closed
+            pass
+
+    # the human played move (None if the game is over), returns True if the reply is posted
+    # or will be posted when the running search of exactly this move ends
+    def resolve(self, move):
+        with self.lock:
+            self.played = move
+            if move is not None and move not in self.replies and self.current == move:
+                return True
+        reply = self.replies.get(move)
+        self.cancel()
+        if reply is None:
+            return False
+        self.post(reply)
+        return True
+
+    # stops the search and waits for the thread, afterwards the worker can search again
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+        # stop is repeated, a search that starts after the first stop would set a new deadline
+        while self.thread.is_alive():
+            self.worker.search.stop()
+            self.thread.join(0.01)
+        self.worker.search.deadline = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='connect 4 with a minimax ai')
+    parser.add_argument('--mode', choices=PLAYER_COLORS + ('headless',), default=None,
+                        help='side of the human player, ai_vs_ai, pvp or headless (ai vs ai without a window); '
+                             'asked in the window if not given')
+    parser.add_argument('--depth', type=int, default=SEARCH_DEPTH, help='search depth, used when --time is 0')
+    parser.add_argument('--time', type=int, default=MOVE_TIME, help='time budget of the ai per move in milliseconds')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random opening moves')
+    parser.add_argument('--opening-plies', type=int, default=0, help='number of random opening moves')
+    parser.add_argument('--book', default=None, help='opening book file built with OpeningBook.py')
+    parser.add_argument('--stats', default=None,
+                        help='file for json lines with search statistics per move, - for stdout')
+    parser.add_argument('--profile', choices=('cprofile', 'pyinstrument'), default=None,
+                        help='run the game under a profiler and print the report to stderr')
+    parser.add_argument('--ponder', action='store_true', help='let the ai search on the time of the human player')
+    parser.add_argument('--rows', type=int, default=STANDARD.rows, help='number of rows of the board')
+    parser.add_argument('--columns', type=int, default=STANDARD.columns, help='number of columns, at most 9')
+    parser.add_argument('--connect', type=int, default=STANDARD.connect, help='number of pieces in a row that wins')
+    args = parser.parse_args(argv)
+
+    if args.depth < 2:
+        parser.error('--depth has to be at least 2, the ai searches depth - 1 plies')
+    if not 1 <= args.columns <= 9:
+        parser.error('--columns has to be between 1 and 9, the columns are chosen with the keys 1 to 9')
+    try:
+        geometry = board_geometry(args.rows, args.columns, args.connect)
+    except ValueError as error:
+        parser.error(str(error))
+    if args.book and geometry is not STANDARD:
+        parser.error('the opening book only works on the standard board')
+    book = OpeningBook(args.book) if args.book else None
+    game = Game(args.depth, args.time or None, book, geometry)
+    stream = None
+    if args.stats:
+        stream = sys.stdout if args.stats == '-' else open(args.stats, 'a')
+        game.search.stats = SearchStats(stream)
+    random_opening(game.position, args.opening_plies, random.Random(args.seed))
+
+    if args.mode == 'headless':
+        run = game.play_ai_only
+    else:
+        game.player_color = args.mode
+        game.ponder = args.ponder
+        run = game.play_pygame
+    try:
+        if args.profile:
+            return profile(run, args.profile)
+        return run()
+    finally:
+        if stream is not None and stream is not sys.stdout:
+            stream.close()
+
+
+if __name__ == '__main__':
+    main()
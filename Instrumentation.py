@@ -0,0 +1,105 @@
+import json
+import sys
+import time
+
+from Bitboard import STANDARD
+
+
+# records what a Search does during one move and writes it as one json line when the move is chosen
+# it is enabled by setting search.stats, without it the search only pays for one None check per node
+class SearchStats:
+    def __init__(self, stream=None):
+        self.stream = stream if stream is not None else sys.stdout
+        # the json records of all moves written so far
+        self.records = []
+        self.begin(None)
+
+    # clears the counters, the ply of a node is counted from the position the search starts in
+    def begin(self, position):
+        self.root = len(position.history) if position is not None else 0
+        size = position.geometry.size if position is not None else STANDARD.size
+        self.nodes = [0] * (size + 1)
+        self.expansions = [0] * (size + 1)
+        self.children = [0] * (size + 1)
+        self.cutoffs = [0] * (size + 1)
+        self.leaves = 0
+        self.terminals = 0
+        # seconds spent in the terminal checks, the heuristic and the move generation (table probe and ordering)
+        self.time_state = 0.0
+        self.time_heuristic = 0.0
+        self.time_moves = 0.0
+
+    def node(self, moves):
+        self.nodes[moves - self.root] += 1
+
+    def leaf(self, started):
+        self.leaves += 1
+        self.time_heuristic += time.perf_counter() - started
+
+    # a node searched children moves, cutoff is set if one of them failed high
+    def expanded(self, moves, children, cutoff):
+        ply = moves - self.root
+        self.expansions[ply] += 1
+        self.children[ply] += children
+        if cutoff:
+            self.cutoffs[ply] += 1
+
+    def end(self, move, value, depth, nodes, elapsed):
+        plies = []
+        for ply in range(len(self.nodes)):
+            if self.nodes[ply] == 0:
+                break
+            expansions = self.expansions[ply]
+            plies.append({
+                'ply': ply,
+                'nodes': self.nodes[ply],
+                'expanded': expansions,
+                'branching': round(self.children[ply] / expansions, 3) if expansions else 0.0,
+                'cutoff_rate': round(self.cutoffs[ply] / expansions, 3) if expansions else 0.0,
+            })
+        record = {
+            'moves_played': self.root,
+            'move': move,
+            'value': value,
+            'depth': depth,
+            'nodes': nodes,
+            'leaf_evaluations': self.leaves,
+            'terminal_hits': self.terminals,
+            'time_ms': {
+                'total': round(elapsed, 3),
+                'board_state': round(self.time_state * 1000, 3),
+                'heuristic': round(self.time_heuristic * 1000, 3),
+                'move_generation': round(self.time_moves * 1000, 3),
+            },
+            'plies': plies,
+        }
+        self.records.append(record)
+        self.stream.write(json.dumps(record) + '\n')
+        self.stream.flush()
+
+
+# runs function() under cProfile or pyinstrument and prints the report to stderr
+def profile(function, kind='cprofile'):
+    if kind == 'cprofile':
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(function)
+        finally:
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(30)
+
+    if kind == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise SystemExit('pyinstrument is not installed, use --profile cprofile or pip install pyinstrument')
+        profiler = Profiler()
+        profiler.start()
+        try:
+            return function()
+        finally:
+            profiler.stop()
+            sys.stderr.write(profiler.output_text(unicode=True, color=False))
+
+    raise ValueError('unknown profiler {}'.format(kind))
@@ -0,0 +1,157 @@
+import argparse
+import mmap
+import struct
+import time
+from collections import namedtuple
+
+from Bitboard import Bitboard, position_from_moves
+from Evaluation import Evaluator
+from Search import Search
+from TranspositionTable import TranspositionTable
+
+# file layout: a header followed by records sorted by position key
+# header: magic, version, number of plies covered, search depth, number of records
+HEADER = struct.Struct('<4sHHII')
+MAGIC = b'C4BK'
+# version 2 stores a position and its mirror once under Bitboard.canonical_key
+VERSION = 2
+# record: canonical position key, value for the player to move, best move in the canonical orientation, padding
+RECORD = struct.Struct('<Qfb3x')
+KEY = struct.Struct('<Q')
+
+# move and value stored for a position, the value is seen from the player to move
+BookEntry = namedtuple('BookEntry', ['move', 'value'])
+
+DEFAULT_PATH = 'opening_book.bin'
+
+
+# read only view of a book file, the records are not copied, every process shares the page cache
+class OpeningBook:
+    def __init__(self, path=DEFAULT_PATH):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.plies, self.depth, self.count) = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError('{} is not an opening book of version {}'.format(path, VERSION))
+        if len(self.map) != HEADER.size + self.count * RECORD.size:
+            self.close()
+            raise ValueError('{} is truncated'.format(path))
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    # binary search for the key, returns the BookEntry or None
+    def find(self, key):
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            (k,) = KEY.unpack_from(self.map, HEADER.size + middle * RECORD.size)
+            if k < key:
+                low = middle + 1
+            elif k > key:
+                high = middle
+            else:
+                (k, value, move) = RECORD.unpack_from(self.map, HEADER.size + middle * RECORD.size)
+                return BookEntry(move, value)
+        return None
+
+    def lookup(self, position):
+        if len(position.history) > self.plies:
+            return None
+        (key, mirrored) = position.canonical_key()
+        entry = self.find(key)
+        if entry is not None and mirrored:
+            return BookEntry(position.mirror_move(entry.move), entry.value)
+        return entry
+
+
+# all positions with at most plies moves that are not finished, every position once and no mirror of one
+def _positions(plies):
+    position = Bitboard()
+    seen = set()
+    stack = [(position, 0)]
+    while stack:
+        (position, ply) = stack.pop()
+        (key, mirrored) = position.canonical_key()
+        if key in seen:
+            continue
+        seen.add(key)
+        yield position
+        if ply == plies:
+            continue
+        for move in position.legal_moves():
+            child = position.copy()
+            child.play(move)
+            if child.state() is None:
+                stack.append((child, ply + 1))
+
+
+# searches every position of the first plies moves and writes the sorted records
+def build(path, plies, depth, alpha=0.5, beta=0.5, table_size_mb=64, verbose=True):
+    evaluator = Evaluator(alpha, beta)
+    search = Search(lambda position: evaluator.value(), TranspositionTable(table_size_mb))
+    records = []
+    start = time.perf_counter()
+    for position in _positions(plies):
+        evaluator.attach(position)
+        (value, move) = search.iterate(position, depth)
+        (key, mirrored) = position.canonical_key()
+        records.append((key, value, position.mirror_move(move) if mirrored else move))
+        if verbose and len(records) % 1000 == 0:
+            print('{} positions, {:.0f} s'.format(len(records), time.perf_counter() - start))
+    records.sort()
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, plies, depth, len(records)))
+        for record in records:
+            f.write(RECORD.pack(*record))
+    if verbose:
+        print('wrote {} positions to {} in {:.0f} s'.format(len(records), path, time.perf_counter() - start))
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='build or query the opening book')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='search all positions of the first plies and write the book')
+    build_parser.add_argument('--plies', type=int, default=4, help='number of moves covered by the book')
+    build_parser.add_argument('--depth', type=int, default=8, help='search depth per position in plies')
+    build_parser.add_argument('--alpha', type=float, default=0.5)
+    build_parser.add_argument('--beta', type=float, default=0.5)
+    build_parser.add_argument('--out', default=DEFAULT_PATH)
+    probe_parser = commands.add_parser('probe', help='print the book move of a position')
+    probe_parser.add_argument('--book', default=DEFAULT_PATH)
+    probe_parser.add_argument('moves', nargs='*', type=int, help='played columns from 1 to 7')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        if args.depth < 1:
+            parser.error('--depth has to be at least 1')
+        build(args.out, args.plies, args.depth, args.alpha, args.beta)
+    else:
+        try:
+            position = position_from_moves(args.moves)
+        except ValueError as error:
+            parser.error(str(error))
+        with OpeningBook(args.book) as book:
+            entry = book.lookup(position)
+        if entry is None:
+            print('position is not in the book')
+        else:
+            print('move {}, value {:.4f}'.format(entry.move + 1, entry.value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Bitboard import COLUMNS, ROWS, Bitboard, position_from_moves, random_opening
+from Evaluation import Evaluator
+from Search import CENTER_ORDER, WIN_BONUS, WIN_SCORE, Search, SearchResult
+from TranspositionTable import TranspositionTable
+
+# memory cap of the transposition table of every worker process
+TABLE_SIZE_MB = 16
+
+# search and evaluator of a worker process, kept between calls so that the table is reused
+_worker = None
+
+
+def _init_worker(alpha, beta, table_size_mb):
+    global _worker
+    evaluator = Evaluator(alpha, beta)
+    _worker = (evaluator, Search(lambda position: evaluator.value(), TranspositionTable(table_size_mb)))
+
+
+# what a worker needs to rebuild a position, replaying history is not enough because
+# positions built by Bitboard.from_array keep their columns in history but not the move order
+def _position_state(position):
+    return (position.pieces, position.heights, position.history, position.current_player, position.hash,
+            position.mirror_hash)
+
+
+def _rebuild(state):
+    position = Bitboard()
+    (pieces, heights, history, position.current_player, position.hash, position.mirror_hash) = state
+    position.pieces = pieces[:]
+    position.heights = heights[:]
+    position.history = history[:]
+    return position
+
+
+# value of one root move for the player who makes it, searched in a worker process
+# values up to alpha are only upper bounds, values above alpha are exact
+def _search_move(state, move, depth, alpha):
+    (evaluator, search) = _worker
+    position = _rebuild(state)
+    evaluator.attach(position)
+    player = position.current_player
+    position.play(move)
+
+    search.nodes = 0
+    if position.has_won(player):
+        return move, WIN_SCORE + (depth - 1) * WIN_BONUS, 1
+    if len(position.history) == ROWS * COLUMNS:
+        return move, 0, 1
+    if depth <= 1:
+        value = evaluator.value()
+        return move, -value if position.current_player == 1 else value, 1
+    (value, reply) = search.iterate(position, depth - 1, -2, -alpha)
+    return move, -value, search.nodes
+
+
+# splits the root moves of a search across worker processes
+# the first move in center order is searched alone, its value is the alpha of all other moves
+# the result does not depend on which worker finishes first
+class ParallelSearch:
+    def __init__(self, workers=None, alpha=0.5, beta=0.5, table_size_mb=TABLE_SIZE_MB):
+        self.workers = workers or os.cpu_count() or 1
+        self.alpha = alpha
+        self.beta = beta
+        self.table_size_mb = table_size_mb
+        self.executor = None
+        self.search = None
+        self.evaluator = None
+        if self.workers > 1:
+            self.executor = ProcessPoolExecutor(self.workers, initializer=_init_worker,
+                                                initargs=(alpha, beta, table_size_mb))
+        else:
+            # one worker searches in this process with the normal search
+            self.evaluator = Evaluator(alpha, beta)
+            self.search = Search(lambda position: self.evaluator.value(), TranspositionTable(table_size_mb))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # searches depth plies and returns a SearchResult, the value is seen from the player to move
+    def run(self, position, depth):
+        start = time.perf_counter()
+        # checked here so that one and several workers accept the same depths
+        if depth < 1:
+            raise ValueError('the search depth has to be at least 1, not {}'.format(depth))
+        if position.state() is not None:
+            raise ValueError('{!r} is already finished'.format(position))
+        if self.executor is None:
+            # the copy keeps an evaluator of the caller untouched
+            position = position.copy()
+            self.evaluator.attach(position)
+            (value, move) = self.search.iterate(position, depth)
+            nodes = self.search.nodes
+        else:
+            moves = [j for j in CENTER_ORDER if position.can_play(j)]
+            state = _position_state(position)
+            first = self.executor.submit(_search_move, state, moves[0], depth, -2).result()
+            futures = [self.executor.submit(_search_move, state, j, depth, first[1]) for j in moves[1:]]
+            (move, value, nodes) = first
+            for future in futures:
+                (j, v, n) = future.result()
+                nodes += n
+                # only a value above the first one is exact, ties keep the move earlier in center order
+                if v > value:
+                    (move, value) = (j, v)
+        elapsed = (time.perf_counter() - start) * 1000
+        return SearchResult(move, value, depth, nodes, elapsed, [move])
+
+
+# compares the time of one and of several workers at equal depth on random positions
+def benchmark(workers, depth, positions=5, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for k in range(positions):
+        position = Bitboard()
+        random_opening(position, rng.randrange(0, 12), rng)
+        corpus.append(position)
+
+    timings = {}
+    for n in (1, workers):
+        with ParallelSearch(n) as search:
+            # starts the worker processes before the clock runs
+            search.run(corpus[0], 1)
+            start = time.perf_counter()
+            results = [search.run(position, depth) for position in corpus]
+            timings[n] = (time.perf_counter() - start, results)
+
+    (single, single_results) = timings[1]
+    (parallel, parallel_results) = timings[workers]
+    same = sum(abs(a.value - b.value) < 1e-9 for (a, b) in zip(single_results, parallel_results))
+    print('depth {}, {} positions, {} of them with equal values'.format(depth, positions, same))
+    print('1 worker: {:.2f} s, {} nodes'.format(single, sum(r.nodes for r in single_results)))
+    print('{} workers: {:.2f} s, {} nodes, speedup {:.2f}'.format(
+        workers, parallel, sum(r.nodes for r in parallel_results), single / parallel))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='root parallel search of one position')
+    parser.add_argument('moves', nargs='?', default='', help='played columns from 1 to 7')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes, 1 disables it')
+    parser.add_argument('--depth', type=int, default=8, help='search depth in plies')
+    parser.add_argument('--benchmark', action='store_true', help='compare with the single process search')
+    args = parser.parse_args()
+
+    if args.depth < 1:
+        parser.error('--depth has to be at least 1')
+    if args.benchmark:
+        benchmark(args.workers, args.depth)
+        return
+    try:
+        position = position_from_moves(args.moves)
+    except ValueError as error:
+        parser.error(str(error))
+    with ParallelSearch(args.workers) as search:
+        result = search.run(position, args.depth)
+    print('move {}, value {:.4f}, {} nodes, {:.0f} ms'.format(result.move + 1, result.value, result.nodes, result.time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+import time
+from collections import namedtuple
+
+from Bitboard import STANDARD, is_win_at
+from TranspositionTable import EXACT, LOWER, UPPER
+
+# value of a won game, wins found with more remaining depth get a small bonus so that faster wins are preferred
+WIN_SCORE = 1
+WIN_BONUS = 0.01
+
+# columns in the center take part in more lines, so they are tried first, Geometry.center_order for other sizes
+CENTER_ORDER = STANDARD.center_order
+
+# the clock is only read every CHECK_INTERVAL + 1 nodes
+CHECK_INTERVAL = 255
+
+# result of a timed search, value is seen from the player to move and time is in milliseconds
+SearchResult = namedtuple('SearchResult', ['move', 'value', 'depth', 'nodes', 'time', 'pv'])
+
+
+# raised inside the search when the time budget is used up
+class SearchTimeout(Exception):
+    pass
+
+
+# negamax search with alpha-beta pruning, all values are seen from the player to move
+class Search:
+    def __init__(self, evaluate, table=None):
+        # evaluate(position) returns the heuristic value of the position for player 1 (blue)
+        self.evaluate = evaluate
+        # optional TranspositionTable, shared between searches
+        self.table = table
+        # number of visited positions since the last reset
+        self.nodes = 0
+        # best move of the last finished search, it is tried first in the next one
+        self.best_move = None
+        # perf_counter time at which a timed search stops, None for no limit
+        self.deadline = None
+        # optional Instrumentation.SearchStats that records every move
+        self.stats = None
+
+    # ends a running search from another thread at its next clock check, it raises SearchTimeout
+    # unless it was started by think, which returns the move of the last completed depth
+    def stop(self):
+        self.deadline = 0
+
+    # move order for a node, the given move is tried before the center-first order
+    @staticmethod
+    def order_moves(first_move=None, order=CENTER_ORDER):
+        if first_move is None:
+            return order
+        return [first_move] + [j for j in order if j != first_move]
+
+    # searches depth plies and returns (value, move), the value is seen from the player to move
+    def search(self, position, depth, alpha=-2, beta=2, first_move=None):
+        best_value = -2
+        best_move = None
+        children = 0
+        if self.stats is not None:
+            self.stats.node(len(position.history))
+
+        for j in self.order_moves(first_move, position.geometry.center_order):
+            if not position.can_play(j):
+                continue
+            children += 1
+            value = self.play_and_search(position, j, depth - 1, -beta, -alpha)
+
+            if value > best_value:
+                best_value = value
+                best_move = j
+
+            if best_value > alpha:
+                alpha = best_value
+            if alpha >= beta:
+                break
+
+        if self.stats is not None:
+            self.stats.expanded(len(position.history), children, best_value >= beta)
+        self.best_move = best_move
+        return best_value, best_move
+
+    # searches depth 1 to depth, every iteration starts with the best move of the one before
+    def iterate(self, position, depth, alpha=-2, beta=2):
+        if depth < 1:
+            raise ValueError('the search depth has to be at least 1, not {}'.format(depth))
+        start = time.perf_counter()
+        self.nodes = 0
+        self.best_move = None
+        if self.stats is not None:
+            self.stats.begin(position)
+        for d in range(1, depth + 1):
+            result = self.search(position, d, alpha, beta, self.best_move)
+        if self.stats is not None:
+            self.stats.end(result[1], result[0], depth, self.nodes, (time.perf_counter() - start) * 1000)
+        return result
+
+    # searches one ply deeper at a time until the time budget in milliseconds is used up
+    # the move of the last completed depth is returned, the principal variation of a depth orders the next one
+    def think(self, position, time_ms, max_depth=None):
+        start = time.perf_counter()
+        if max_depth is None:
+            max_depth = position.geometry.size - len(position.history)
+        moves = len(position.history)
+
+        self.nodes = 0
+        self.best_move = None
+        self.deadline = start + time_ms / 1000
+        if self.stats is not None:
+            self.stats.begin(position)
+        value = 0
+        move = None
+        reached = 0
+        try:
+            for depth in range(1, max_depth + 1):
+                (value, move) = self.search(position, depth, -2, 2, self.best_move)
+                reached = depth
+                # a proven result does not change with more depth
+                if abs(value) >= WIN_SCORE:
+                    break
+        except SearchTimeout:
+            # take back the moves of the aborted iteration
+            while len(position.history) > moves:
+                position.undo()
+        finally:
+            self.deadline = None
+
+        # not even one ply was searched, play the first legal move
+        if move is None:
+            move = next(j for j in position.geometry.center_order if position.can_play(j))
+        self.best_move = move
+
+        elapsed = (time.perf_counter() - start) * 1000
+        if self.stats is not None:
+            self.stats.end(move, value, reached, self.nodes, elapsed)
+        return SearchResult(move, value, reached, self.nodes, elapsed, self.principal_variation(position, move))
+
+    # best move of the position stored in the transposition table, None if there is none
+    def table_move(self, position):
+        if self.table is None:
+            return None
+        mirrored = position.mirror_hash < position.hash
+        entry = self.table.probe(position.mirror_hash if mirrored else position.hash)
+        if entry is None or entry[4] is None:
+            return None
+        move = position.mirror_move(entry[4]) if mirrored else entry[4]
+        return move if position.can_play(move) else None
+
+    # follows the best moves stored in the transposition table, starting with the given move
+    def principal_variation(self, position, move):
+        pv = [move]
+        if self.table is None:
+            return pv
+        moves = len(position.history)
+        player = position.current_player
+        position.play(move)
+        while not position.has_won(player) and len(pv) < position.geometry.size:
+            reply = self.table_move(position)
+            if reply is None:
+                break
+            pv.append(reply)
+            player = position.current_player
+            position.play(reply)
+        while len(position.history) > moves:
+            position.undo()
+        return pv
+
+    # plays the move, returns its value for the player who made it and takes it back
+    def play_and_search(self, position, column, depth, alpha, beta):
+        player = position.current_player
+        position.play(column)
+        if position.has_won(player):
+            self.nodes += 1
+            value = WIN_SCORE + depth * WIN_BONUS
+        else:
+            value = -self.negamax(position, depth, alpha, beta)
+        position.undo()
+        return value
+
+    def negamax(self, position, depth, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & CHECK_INTERVAL and self.deadline is not None and time.perf_counter() > self.deadline:
+            raise SearchTimeout()
+        # Instrumentation.SearchStats, every use is behind one check so that a disabled recorder costs nothing
+        stats = self.stats
+        if stats is not None:
+            stats.node(len(position.history))
+
+        # the board is full and nobody won
+        geometry = position.geometry
+        if len(position.history) == geometry.size:
+            if stats is not None:
+                stats.terminals += 1
+            return 0
+
+        # if the depth limit is reached return heuristic
+        if depth <= 0:
+            if stats is not None:
+                started = time.perf_counter()
+                value = self.evaluate(position)
+                stats.leaf(started)
+            else:
+                value = self.evaluate(position)
+            return value if position.current_player == 1 else -value
+
+        if stats is not None:
+            started = time.perf_counter()
+        # look up the position, a deep enough entry can end the search here
+        table = self.table
+        order = geometry.center_order
+        if table is not None:
+            # a position and its mirror share one entry under the smaller hash, its move is stored for that side
+            key = position.hash
+            mirrored = position.mirror_hash < key
+            if mirrored:
+                key = position.mirror_hash
+            entry = table.probe(key)
+            if entry is not None:
+                if entry[1] >= depth:
+                    bound = entry[2]
+                    value = entry[3]
+                    if bound == EXACT:
+                        return value
+                    if bound == LOWER and value >= beta:
+                        return value
+                    if bound == UPPER and value <= alpha:
+                        return value
+                if entry[4] is not None:
+                    order = self.order_moves(geometry.columns - 1 - entry[4] if mirrored else entry[4], order)
+        alpha_start = alpha
+        if stats is not None:
+            stats.time_moves += time.perf_counter() - started
+
+        best_value = -2
+        best_move = None
+        children = 0
+        pieces = position.pieces
+        player = position.current_player
+        line_masks = geometry.line_masks
+        for j in order:
+            if not position.can_play(j):
+                continue
+
+            children += 1
+            # a new four in a row has to go through the square of the move
+            bit = position.heights[j]
+            position.play(j)
+            if stats is not None:
+                started = time.perf_counter()
+                won = is_win_at(pieces[player - 1], bit, line_masks)
+                stats.time_state += time.perf_counter() - started
+            else:
+                won = is_win_at(pieces[player - 1], bit, line_masks)
+            if won:
+                self.nodes += 1
+                if stats is not None:
+                    stats.terminals += 1
+                value = WIN_SCORE + (depth - 1) * WIN_BONUS
+            else:
+                value = -self.negamax(position, depth - 1, -beta, -alpha)
+            position.undo()
+
+            if value > best_value:
+                best_value = value
+                best_move = j
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        if stats is not None:
+            stats.expanded(len(position.history), children, best_value >= beta)
+
+        if table is not None:
+            if best_value <= alpha_start:
+                bound = UPPER
+            elif best_value >= beta:
+                bound = LOWER
+            else:
+                bound = EXACT
+            if mirrored and best_move is not None:
+                best_move = geometry.columns - 1 - best_move
+            table.store(key, depth, bound, best_value, best_move)
+
+        return best_value
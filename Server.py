@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from Bitboard import Bitboard
+from Evaluation import Evaluator
+from Search import Search
+from TranspositionTable import TranspositionTable
+
+# protocol: one json object per line in both directions
+# requests carry an optional id that is copied into the response, so that a client can send many at once
+#   {"op": "new", "ai": "red"}             starts a game, ai is "blue", "red" or null for two humans
+#   {"op": "move", "game": 1, "column": 3} plays a column from 0 to 6, the ai answers in the same response
+#   {"op": "state", "game": 1}
+#   {"op": "close", "game": 1}
+# responses: {"id": ..., "ok": true, "game": 1, "moves": [...], "to_move": 1, "state": null, "ai_move": 3}
+#            {"id": ..., "ok": false, "error": "..."}
+
+HOST = '127.0.0.1'
+PORT = 4444
+
+# memory cap of the transposition table of every worker process
+TABLE_SIZE_MB = 16
+
+# evaluator and search of a worker process
+_worker = None
+
+
+def _init_worker(alpha, beta):
+    global _worker
+    evaluator = Evaluator(alpha, beta)
+    _worker = (evaluator, Search(lambda position: evaluator.value(), TranspositionTable(TABLE_SIZE_MB)))
+
+
+# best move of the position after the given moves, runs in a worker process
+def _ai_move(history, depth, time_ms):
+    (evaluator, search) = _worker
+    position = Bitboard()
+    for j in history:
+        position.play(j)
+    evaluator.attach(position)
+    if time_ms:
+        return search.think(position, time_ms, depth).move
+    return search.iterate(position, depth)[1]
+
+
+# state of one game on the server, only the bitboard and the ai settings
+class Session:
+    __slots__ = ('position', 'ai', 'busy')
+
+    def __init__(self, ai):
+        self.position = Bitboard()
+        # player number of the ai, None for two humans
+        self.ai = ai
+        # set while the ai searches, moves are refused meanwhile
+        self.busy = False
+
+    def describe(self, game_id):
+        return {'game': game_id, 'moves': self.position.history, 'to_move': self.position.current_player,
+                'state': self.position.state()}
+
+
+# hosts many games at once, ai moves run on a process pool so that the event loop never waits for a search
+class GameServer:
+    def __init__(self, workers=None, depth=5, time_ms=None, alpha=0.5, beta=0.5):
+        self.depth = depth
+        self.time_ms = time_ms
+        self.sessions = {}
+        self.next_id = 1
+        self.executor = ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(alpha, beta))
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+    async def ai_reply(self, session):
+        session.busy = True
+        try:
+            loop = asyncio.get_running_loop()
+            move = await loop.run_in_executor(self.executor, _ai_move, list(session.position.history),
+                                              self.depth, self.time_ms)
+        finally:
+            session.busy = False
+        session.position.play(move)
+        return move
+
+    async def dispatch(self, request):
+        if not isinstance(request, dict):
+            raise ValueError('a request has to be a json object')
+        op = request.get('op')
+        if op == 'new':
+            ai = request.get('ai')
+            if ai not in ('blue', 'red', None):
+                raise ValueError('ai has to be "blue", "red" or null')
+            ai = {'blue': 1, 'red': 2, None: None}[ai]
+            game_id = self.next_id
+            self.next_id += 1
+            session = Session(ai)
+            self.sessions[game_id] = session
+            response = {}
+            if session.ai == 1:
+                try:
+                    response['ai_move'] = await self.ai_reply(session)
+                except Exception:
+                    # the client gets no game id, so nobody could ever close the game
+                    del self.sessions[game_id]
+                    raise
+            response.update(session.describe(game_id))
+            return response
+
+        game_id = request.get('game')
+        # json true is a python bool and so an int, it is no game id or column
+        session = self.sessions.get(game_id) if type(game_id) is int else None
+        if session is None:
+            raise ValueError('unknown game {}'.format(game_id))
+
+        if op == 'state':
+            return session.describe(game_id)
+        if op == 'close':
+            del self.sessions[game_id]
+            return {'game': game_id}
+        if op == 'move':
+            column = request.get('column')
+            position = session.position
+            if session.busy:
+                raise ValueError('the ai is still searching')
+            if position.state() is not None:
+                raise ValueError('the game is over')
+            if position.current_player == session.ai:
+                raise ValueError('it is the turn of the ai')
+            if type(column) is not int or not 0 <= column < 7 or not position.can_play(column):
+                raise ValueError('column {} can not be played'.format(column))
+            position.play(column)
+            response = {}
+            if session.ai is not None and position.state() is None:
+                try:
+                    response['ai_move'] = await self.ai_reply(session)
+                except Exception:
+                    # the move is taken back, so that the client can send it again
+                    position.undo()
+                    raise
+            response.update(session.describe(game_id))
+            return response
+        raise ValueError('unknown op {}'.format(op))
+
+    async def respond(self, line, writer):
+        request_id = None
+        try:
+            request = json.loads(line)
+            if isinstance(request, dict):
+                request_id = request.get('id')
+            response = {'id': request_id, 'ok': True}
+            response.update(await self.dispatch(request))
+        except ValueError as error:
+            response = {'id': request_id, 'ok': False, 'error': str(error)}
+        except Exception as error:
+            # every request gets an answer, also when a worker process died and broke the pool
+            response = {'id': request_id, 'ok': False, 'error': 'internal error: {!r}'.format(error)}
+        if not writer.is_closing():
+            writer.write((json.dumps(response) + '\n').encode())
+
+    # every request of a connection is answered in its own task, a slow ai move does not block the others
+    async def handle(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self.respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+# client connection that can have many requests in flight, responses are matched by id
+class Client:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.next_id = 1
+        self.listener = asyncio.create_task(self.listen())
+
+    @classmethod
+    async def connect(cls, host=HOST, port=PORT):
+        (reader, writer) = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def listen(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.pending.pop(response['id'], None)
+            if future is not None:
+                future.set_result(response)
+
+    async def request(self, **request):
+        request['id'] = self.next_id
+        self.next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request['id']] = future
+        self.writer.write((json.dumps(request) + '\n').encode())
+        return await future
+
+    async def close(self):
+        self.listener.cancel()
+        self.writer.close()
+
+
+# one game of random human moves against the ai, returns the latency of every move request in seconds
+async def _play_random_game(client, rng):
+    response = await client.request(op='new', ai='red')
+    game_id = response['game']
+    latencies = []
+    while response['state'] is None:
+        position = Bitboard()
+        for j in response['moves']:
+            position.play(j)
+        start = time.perf_counter()
+        response = await client.request(op='move', game=game_id, column=rng.choice(position.legal_moves()))
+        latencies.append(time.perf_counter() - start)
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+    await client.request(op='close', game=game_id)
+    return latencies
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+# plays games concurrent games over connections connections and prints the move latencies
+async def load_test(games=1000, connections=50, host=HOST, port=PORT, seed=0):
+    clients = [await Client.connect(host, port) for k in range(connections)]
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[_play_random_game(clients[k % connections], random.Random(rng.getrandbits(32)))
+                                     for k in range(games)])
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+
+    latencies = [t for game in results for t in game]
+    print('{} concurrent games over {} connections, {} moves in {:.1f} s ({:.0f} moves/s)'.format(
+        games, connections, len(latencies), elapsed, len(latencies) / elapsed))
+    print('move latency p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+        1000 * _percentile(latencies, 50), 1000 * _percentile(latencies, 99), 1000 * max(latencies)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='connect 4 game server and load test client')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help='run the server')
+    serve_parser.add_argument('--host', default=HOST)
+    serve_parser.add_argument('--port', type=int, default=PORT)
+    serve_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='processes for the ai moves')
+    serve_parser.add_argument('--depth', type=int, default=5, help='search depth of the ai in plies')
+    serve_parser.add_argument('--time', type=int, default=None, help='time budget of the ai per move in ms')
+    load_parser = commands.add_parser('load-test', help='play many concurrent games against a running server')
+    load_parser.add_argument('--host', default=HOST)
+    load_parser.add_argument('--port', type=int, default=PORT)
+    load_parser.add_argument('--games', type=int, default=1000)
+    load_parser.add_argument('--connections', type=int, default=50)
+    load_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        if args.depth < 1:
+            parser.error('--depth has to be at least 1')
+        server = GameServer(args.workers, args.depth, args.time)
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+    else:
+        asyncio.run(load_test(args.games, args.connections, args.host, args.port, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+import argparse
+import os
+import random
+import time
+from collections import namedtuple
+
+from Bitboard import BOARD_MASK, BOTTOM_MASK, COLUMNS, HEIGHT, ROWS, Bitboard, position_from_moves
+from Search import CENTER_ORDER
+
+# exact scores: a positive score means the player to move wins, the sooner the higher
+# the score of a win with the k-th stone of the board is (ROWS * COLUMNS + 2 - k) // 2
+SIZE = ROWS * COLUMNS
+MIN_SCORE = -SIZE // 2 + 3
+
+# number of transposition table slots, a prime spreads the keys evenly
+TABLE_SIZE = 1048583
+
+COLUMN_MASKS = [((1 << ROWS) - 1) << (j * HEIGHT) for j in range(COLUMNS)]
+BOTTOM_MASKS = [1 << (j * HEIGHT) for j in range(COLUMNS)]
+
+# 'moves score' lines checked by --bench and --check, the scores are proven by the brute force search
+BENCH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'solver_end_v1.txt')
+
+# result of a solved position, distance is the number of plies until the winning stone is played
+SolveResult = namedtuple('SolveResult', ['score', 'result', 'distance', 'nodes', 'time'])
+
+
+# free squares where the pieces would complete four in a row
+def winning_squares(pieces, mask):
+    # vertical
+    r = (pieces << 1) & (pieces << 2) & (pieces << 3)
+
+    for shift in (HEIGHT, HEIGHT - 1, HEIGHT + 1):
+        # horizontal and both diagonals, the gap can be at any of the four places
+        p = (pieces << shift) & (pieces << (2 * shift))
+        r |= p & (pieces << (3 * shift))
+        r |= p & (pieces >> shift)
+        p = (pieces >> shift) & (pieces >> (2 * shift))
+        r |= p & (pieces << shift)
+        r |= p & (pieces >> (3 * shift))
+
+    return r & (BOARD_MASK ^ mask)
+
+
+# squares the player to move can play without giving the opponent an immediate win
+# the position must not have an immediate win for the player to move
+def non_losing_moves(current, mask):
+    possible = (mask + BOTTOM_MASK) & BOARD_MASK
+    opponent_win = winning_squares(current ^ mask, mask)
+    forced = possible & opponent_win
+    if forced:
+        # two threats at once can not both be blocked
+        if forced & (forced - 1):
+            return 0
+        possible = forced
+    # do not play below a square where the opponent would win
+    return possible & ~(opponent_win >> 1)
+
+
+# the player to move can win with the next stone
+def can_win_next(current, mask):
+    return winning_squares(current, mask) & ((mask + BOTTOM_MASK) & BOARD_MASK) != 0
+
+
+# number of plies until the winning stone is played with perfect play, None for a draw
+def distance(score, moves):
+    if score == 0:
+        return None
+    # the player to move plays the stones moves + 1, moves + 3, ... and the opponent the stones in between
+    parity = (moves + (score > 0)) % 2
+    k = SIZE + 2 - 2 * abs(score)
+    if k % 2 != parity:
+        k -= 1
+    return k - moves
+
+
+# exact solver: null window search over bitboards with a transposition table of upper bounds
+class Solver:
+    def __init__(self, table_size=TABLE_SIZE):
+        self.table_size = table_size
+        # -1 is no key, 0 is the key of the empty board
+        self.keys = [-1] * table_size
+        self.values = [0] * table_size
+        self.nodes = 0
+
+    def reset(self):
+        self.keys = [-1] * self.table_size
+        self.values = [0] * self.table_size
+        self.nodes = 0
+
+    def negamax(self, current, mask, moves, alpha, beta):
+        self.nodes += 1
+
+        possible = non_losing_moves(current, mask)
+        # every move loses, the opponent wins with the next stone
+        if possible == 0:
+            return -((SIZE - moves) // 2)
+
+        # the last two stones can not win anymore, the game is a draw
+        if moves >= SIZE - 2:
+            return 0
+
+        # the opponent can not win with the next stone, so the lower bound rises
+        low = -((SIZE - 2 - moves) // 2)
+        if alpha < low:
+            alpha = low
+            if alpha >= beta:
+                return alpha
+
+        # the player can not win with the next stone, so the upper bound falls
+        high = (SIZE - 1 - moves) // 2
+        key = current + mask
+        index = key % self.table_size
+        if self.keys[index] == key:
+            high = self.values[index] + MIN_SCORE - 1
+        if beta > high:
+            beta = high
+            if alpha >= beta:
+                return beta
+
+        # moves that create more winning squares first, ties in center order
+        order = []
+        for j in CENTER_ORDER:
+            move = possible & COLUMN_MASKS[j]
+            if move:
+                order.append((-winning_squares(current | move, mask).bit_count(), len(order), move))
+        order.sort()
+
+        opponent = current ^ mask
+        for (threats, k, move) in order:
+            value = -self.negamax(opponent, mask | move, moves + 1, -beta, -alpha)
+            if value >= beta:
+                return value
+            if value > alpha:
+                alpha = value
+
+        # alpha is an upper bound of the position from here on
+        self.keys[index] = key
+        self.values[index] = alpha - MIN_SCORE + 1
+        return alpha
+
+    # exact score of the position for the player to move, weak only tells win, draw or loss (1, 0, -1)
+    def score(self, current, mask, moves, weak=False):
+        if can_win_next(current, mask):
+            return (SIZE + 1 - moves) // 2
+        low = -((SIZE - moves) // 2)
+        high = (SIZE + 1 - moves) // 2
+        if weak:
+            low = -1
+            high = 1
+        # null window searches that halve the interval, tried close to zero first
+        while low < high:
+            middle = low + (high - low) // 2
+            if middle <= 0 and int(low / 2) < middle:
+                middle = int(low / 2)
+            elif middle >= 0 and int(high / 2) > middle:
+                middle = int(high / 2)
+            value = self.negamax(current, mask, moves, middle, middle + 1)
+            if value <= middle:
+                high = value
+            else:
+                low = value
+        return low
+
+    def solve(self, position, weak=False):
+        start = time.perf_counter()
+        self.nodes = 0
+        if position.state() is not None:
+            raise ValueError('{!r} is already finished'.format(position))
+        current = position.pieces[position.current_player - 1]
+        moves = len(position.history)
+        score = self.score(current, position.mask, moves, weak)
+        result = 'win' if score > 0 else 'loss' if score < 0 else 'draw'
+        dist = None if weak else distance(score, moves)
+        return SolveResult(score, result, dist, self.nodes, (time.perf_counter() - start) * 1000)
+
+    # exact score of every legal move, seen from the player to move, None for full columns
+    def analyze(self, position):
+        current = position.pieces[position.current_player - 1]
+        mask = position.mask
+        moves = len(position.history)
+        scores = [None] * COLUMNS
+        for j in range(COLUMNS):
+            if not position.can_play(j):
+                continue
+            move = (mask + BOTTOM_MASKS[j]) & COLUMN_MASKS[j]
+            if winning_squares(current, mask) & move:
+                scores[j] = (SIZE + 1 - moves) // 2
+            elif moves + 1 == SIZE:
+                scores[j] = 0
+            else:
+                scores[j] = -self.score(current ^ mask, mask | move, moves + 1)
+        return scores
+
+    # the move with the best exact score, the center breaks ties
+    def best_move(self, position):
+        scores = self.analyze(position)
+        return max((j for j in CENTER_ORDER if scores[j] is not None), key=lambda j: scores[j])
+
+
+# checks a file of lines 'moves score', the format of the published benchmark sets
+def verify_file(path, solver=None, verbose=True):
+    solver = solver or Solver()
+    failures = 0
+    count = 0
+    start = time.perf_counter()
+    with open(path) as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            (moves, expected) = line.split()
+            result = solver.solve(position_from_moves(moves))
+            count += 1
+            if result.score != int(expected):
+                failures += 1
+                if verbose:
+                    print('{}: expected {}, got {}'.format(moves, expected, result.score))
+    elapsed = time.perf_counter() - start
+    if verbose:
+        print('{} positions, {} failures, {:.3f} s per position'.format(count, failures, elapsed / max(count, 1)))
+    return failures == 0
+
+
+# plain negamax over the whole game tree with the same scores, only usable close to the end of the game
+def _brute_force(position):
+    moves = len(position.history)
+    if moves == SIZE:
+        return 0
+    player = position.current_player
+    for j in position.legal_moves():
+        position.play(j)
+        won = position.has_won(player)
+        position.undo()
+        if won:
+            return (SIZE + 1 - moves) // 2
+    best = -SIZE
+    for j in position.legal_moves():
+        position.play(j)
+        best = max(best, -_brute_force(position))
+        position.undo()
+    return best
+
+
+# compares the solver with the brute force search on random positions close to the end of the game
+def check_solver(positions=100, moves=32, seed=0):
+    rng = random.Random(seed)
+    solver = Solver(1009)
+    checked = 0
+    while checked < positions:
+        position = Bitboard()
+        while len(position.history) < moves and position.state() is None:
+            position.play(rng.choice(position.legal_moves()))
+        if position.state() is not None:
+            continue
+        expected = _brute_force(position)
+        if solver.solve(position).score != expected:
+            raise AssertionError('{!r}: solver {} != brute force {}'.format(position, solver.solve(position).score,
+                                                                             expected))
+        checked += 1
+
+    # the empty board has the key 0, a fresh table must not hold a bound for it
+    high = (SIZE - 1) // 2
+    if solver.negamax(0, 0, 0, high, high + 1) != high:
+        raise AssertionError('empty board: upper bound below {}'.format(high))
+    # an immediate win is one ply away for either player to move
+    for moves in ('121212', '1212324'):
+        result = solver.solve(position_from_moves(moves))
+        if result.distance != 1:
+            raise AssertionError('{}: distance {} of an immediate win'.format(moves, result.distance))
+    if not verify_file(BENCH_PATH, solver, verbose=False):
+        raise AssertionError('{} does not match'.format(BENCH_PATH))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='exact connect 4 solver')
+    parser.add_argument('moves', nargs='*', help='played columns from 1 to 7, for example 4453')
+    parser.add_argument('--weak', action='store_true', help='only compute win, draw or loss')
+    parser.add_argument('--analyze', action='store_true', help='print the score of every move')
+    parser.add_argument('--bench', nargs='?', const=BENCH_PATH,
+                        help='file of "moves score" lines to verify, benchmarks/solver_end_v1.txt without a path')
+    parser.add_argument('--check', action='store_true', help='compare with a brute force search and the benchmark file')
+    args = parser.parse_args()
+
+    if args.check:
+        check_solver()
+        print('solver agrees with the brute force search and {}'.format(os.path.basename(BENCH_PATH)))
+        return
+    solver = Solver()
+    if args.bench:
+        verify_file(args.bench, solver)
+        return
+    for moves in args.moves or ['']:
+        position = position_from_moves(moves)
+        if args.analyze:
+            print(moves, solver.analyze(position))
+            continue
+        result = solver.solve(position, args.weak)
+        print('{}: score {}, {} for the player to move, distance {}, {} nodes, {:.0f} ms'.format(
+            moves or 'empty board', result.score, result.result, result.distance, result.nodes, result.time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import math
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Bitboard import Bitboard, random_opening
+from Evaluation import Evaluator, score
+from Search import Search
+from TranspositionTable import TranspositionTable
+
+# heuristic weights and search depth of one ai, time is an optional budget per move in milliseconds
+PlayerConfig = namedtuple('PlayerConfig', ['alpha', 'beta', 'depth', 'time'], defaults=[None])
+
+# result of one game, result has the meaning of board_state, first_blue tells if player a had blue
+GameResult = namedtuple('GameResult', ['index', 'seed', 'first_blue', 'result', 'moves', 'nodes', 'time'])
+
+# memory cap of the transposition table of every ai in a game
+TABLE_SIZE_MB = 4
+
+
+# a search that evaluates with the weights of one player, the window counts come from the shared evaluator
+def _make_search(config, evaluator):
+    return Search(lambda position: score(evaluator.possible, evaluator.threats, config.alpha, config.beta),
+                  TranspositionTable(TABLE_SIZE_MB))
+
+
+# plays one headless game like Game.play_ai_only, player a is blue if first_blue is set
+def play_game(index, seed, first_blue, config_a, config_b, opening_plies):
+    start = time.perf_counter()
+    rng = random.Random(seed)
+    position = Bitboard()
+    evaluator = Evaluator(config_a.alpha, config_a.beta)
+    evaluator.attach(position)
+    random_opening(position, opening_plies, rng)
+
+    searches = {1: _make_search(config_a, evaluator), 2: _make_search(config_b, evaluator)}
+    configs = {1: config_a, 2: config_b}
+    if not first_blue:
+        searches = {1: searches[2], 2: searches[1]}
+        configs = {1: config_b, 2: config_a}
+
+    nodes = 0
+    result = position.state()
+    while result is None:
+        search = searches[position.current_player]
+        config = configs[position.current_player]
+        if config.time is None:
+            (value, move) = search.iterate(position, config.depth)
+        else:
+            move = search.think(position, config.time, config.depth).move
+        nodes += search.nodes
+        position.play(move)
+        result = position.state()
+
+    return GameResult(index, seed, first_blue, result, len(position.history), nodes, time.perf_counter() - start)
+
+
+# wilson score interval of a rate, z = 1.96 gives 95 percent
+def wilson_interval(successes, n, z=1.96):
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    center = (p + z * z / (2 * n)) / (1 + z * z / n)
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+    return center - half, center + half
+
+
+# win, draw and loss counts of player a with confidence intervals
+class Summary:
+    def __init__(self):
+        self.wins = 0
+        self.draws = 0
+        self.losses = 0
+        self.nodes = 0
+
+    @property
+    def games(self):
+        return self.wins + self.draws + self.losses
+
+    def add(self, game):
+        self.nodes += game.nodes
+        if game.result == 0:
+            self.draws += 1
+        elif (game.result == 1) == game.first_blue:
+            self.wins += 1
+        else:
+            self.losses += 1
+
+    # average points of player a (win 1, draw 0.5) with a normal 95 percent interval
+    def score(self, z=1.96):
+        n = self.games
+        if n == 0:
+            return 0.5, 0.0, 1.0
+        mean = (self.wins + 0.5 * self.draws) / n
+        variance = (self.wins + 0.25 * self.draws) / n - mean * mean
+        half = z * math.sqrt(max(variance, 0.0) / n)
+        return mean, mean - half, mean + half
+
+    def report(self):
+        n = self.games
+        lines = ['games {}: {} wins, {} draws, {} losses for a'.format(n, self.wins, self.draws, self.losses)]
+        for (name, count) in (('win', self.wins), ('draw', self.draws), ('loss', self.losses)):
+            (low, high) = wilson_interval(count, n)
+            lines.append('{} rate {:.3f} (95% {:.3f} - {:.3f})'.format(name, count / n if n else 0.0, low, high))
+        (mean, low, high) = self.score()
+        lines.append('score {:.3f} (95% {:.3f} - {:.3f})'.format(mean, low, high))
+        return '\n'.join(lines)
+
+
+# plays the games on a process pool and yields every GameResult as soon as it is finished
+# pairs of games share a seed and with it the opening, player a has blue in one and red in the other
+def run_tournament(config_a, config_b, games, workers=None, opening_plies=4, seed=0):
+    rng = random.Random(seed)
+    seeds = [rng.getrandbits(63) for pair in range((games + 1) // 2)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(play_game, k, seeds[k // 2], k % 2 == 0, config_a, config_b, opening_plies)
+                   for k in range(games)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='headless ai vs ai tournament on all cores')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes')
+    parser.add_argument('--depth', type=int, default=4, help='search depth in plies of both players')
+    parser.add_argument('--time', type=int, default=None, help='optional time budget per move in milliseconds')
+    parser.add_argument('--opening-plies', type=int, default=4, help='number of random opening moves')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--a', type=float, nargs=2, default=[0.5, 0.5], metavar=('ALPHA', 'BETA'),
+                        help='heuristic weights of player a')
+    parser.add_argument('--b', type=float, nargs=2, default=[0.5, 0.5], metavar=('ALPHA', 'BETA'),
+                        help='heuristic weights of player b')
+    parser.add_argument('--quiet', action='store_true', help='only print the summary')
+    args = parser.parse_args()
+
+    if args.depth < 1:
+        parser.error('--depth has to be at least 1')
+    config_a = PlayerConfig(args.a[0], args.a[1], args.depth, args.time)
+    config_b = PlayerConfig(args.b[0], args.b[1], args.depth, args.time)
+    summary = Summary()
+    start = time.perf_counter()
+    for game in run_tournament(config_a, config_b, args.games, args.workers, args.opening_plies, args.seed):
+        summary.add(game)
+        if not args.quiet:
+            print('game {}: result {}, a is {}, {} moves, {:.2f} s'.format(
+                game.index, game.result, 'blue' if game.first_blue else 'red', game.moves, game.time))
+    elapsed = time.perf_counter() - start
+
+    print(summary.report())
+    print('{} workers, {:.1f} s, {:.2f} games/s, {:.0f} nodes/s'.format(
+        args.workers, elapsed, summary.games / elapsed, summary.nodes / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# bound types of a stored value
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# approximate memory of one stored entry in bytes: the tuple, the 64 bit key, the float value and the list slot
+ENTRY_SIZE = 148
+
+
+# hash table of searched positions with a fixed number of buckets
+# every bucket has a depth-preferred slot and an always-replace slot
+class TranspositionTable:
+    def __init__(self, size_mb=16):
+        self.size = max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_SIZE))
+        # entries are tuples (key, depth, bound, value, move)
+        self.deep = [None] * self.size
+        self.recent = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    def clear(self):
+        self.deep = [None] * self.size
+        self.recent = [None] * self.size
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.stores = 0
+
+    # returns the stored entry of the position or None
+    def probe(self, key):
+        index = key % self.size
+        entry = self.deep[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        other = self.recent[index]
+        if other is not None and other[0] == key:
+            self.hits += 1
+            return other
+        self.misses += 1
+        # the bucket is used by other positions
+        if entry is not None or other is not None:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, bound, value, move):
+        index = key % self.size
+        entry = (key, depth, bound, value, move)
+        self.stores += 1
+        old = self.deep[index]
+        if old is None or old[0] == key or depth >= old[1]:
+            # the replaced deep entry moves down to the always-replace slot
+            if old is not None and old[0] != key:
+                self.recent[index] = old
+            self.deep[index] = entry
+        else:
+            self.recent[index] = entry
+
+    # number of filled slots
+    def used(self):
+        return sum(1 for e in self.deep if e is not None) + sum(1 for e in self.recent if e is not None)
+
+    def stats(self):
+        probes = self.hits + self.misses
+        return {
+            'size_mb': round(2 * self.size * ENTRY_SIZE / (1024 * 1024), 2),
+            'slots': 2 * self.size,
+            'used': self.used(),
+            'stores': self.stores,
+            'hits': self.hits,
+            'misses': self.misses,
+            'collisions': self.collisions,
+            'hit_rate': self.hits / probes if probes else 0.0,
+        }
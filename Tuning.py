@@ -0,0 +1,114 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from Batch import ONGOING, count_features_batch
+from Dataset import iter_chunks, read_shards
+from Evaluation import DEFAULT_WEIGHTS, WEIGHTS_PATH, WINDOW_COUNT
+
+# texel tuning: the probability that blue wins is sigmoid(k * heuristic)
+# k is fitted once for the current weights, then the weights are fitted with k fixed,
+# so the tuned heuristic keeps the scale the search expects from it (below the win score of 1)
+
+# smallest accepted scale k, a heuristic value of 1 then still moves the log odds of a blue win by 0.1
+MIN_SCALE = 0.1
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+# mean logistic loss of the predictions p against the targets y (1 blue won, 0.5 draw, 0 red won)
+def logistic_loss(p, y):
+    p = np.clip(p, 1e-12, 1 - 1e-12)
+    return float(-np.mean(y * np.log(p) + (1 - y) * np.log(1 - p)))
+
+
+# features (possible / 69, threats / 69, blue minus red) and targets of all unfinished positions of a shard directory
+# every shard is read once in chunks, the result is an (N, 2) matrix and an (N,) vector
+def load_features(directory):
+    n = sum(len(shard) for shard in read_shards(directory))
+    features = np.empty((n, 2), dtype=np.float64)
+    targets = np.empty(n, dtype=np.float64)
+    used = 0
+    for chunk in iter_chunks(directory):
+        (status, possible, threats) = count_features_batch(np.stack([chunk['blue'], chunk['red']], axis=1))
+        ongoing = status == ONGOING
+        m = int(ongoing.sum())
+        features[used:used + m, 0] = possible[ongoing] / WINDOW_COUNT
+        features[used:used + m, 1] = threats[ongoing] / WINDOW_COUNT
+        targets[used:used + m] = (chunk['outcome'][ongoing] + 1) / 2
+        used += m
+    return features[:used], targets[:used]
+
+
+# newton steps on the logistic loss of sigmoid(features @ w), the loss is convex so this converges in a few steps
+# raises ValueError if it does not, for example when the features separate the outcomes and w grows without limit
+def fit_logistic(features, targets, w=None, iterations=50, tolerance=1e-10):
+    w = np.zeros(features.shape[1]) if w is None else np.asarray(w, dtype=np.float64)
+    for iteration in range(iterations):
+        p = sigmoid(features @ w)
+        gradient = features.T @ (p - targets) / len(targets)
+        hessian = (features * (p * (1 - p))[:, None]).T @ features / len(targets)
+        step = np.linalg.solve(hessian + 1e-12 * np.eye(len(w)), gradient)
+        w = w - step
+        if not np.all(np.isfinite(w)):
+            break
+        if np.abs(step).max() < tolerance:
+            return w
+    raise ValueError('the logistic fit did not converge in {} steps'.format(iterations))
+
+
+# fitted (alpha, beta), the scale k and the loss before and after the fit
+# raises ValueError if k is below MIN_SCALE, the outcomes then do not grow with the current heuristic
+# and the weights w / k would make the search prefer worse positions or be inf
+def tune(features, targets, weights=DEFAULT_WEIGHTS):
+    current = features @ np.asarray(weights, dtype=np.float64)
+    k = float(fit_logistic(current[:, None], targets)[0])
+    if k < MIN_SCALE:
+        raise ValueError('scale k {:.3f} is below {}, the data do not support the current heuristic'.format(
+            k, MIN_SCALE))
+    before = logistic_loss(sigmoid(k * current), targets)
+    w = fit_logistic(features, targets, np.asarray(weights) * k)
+    after = logistic_loss(sigmoid(features @ w), targets)
+    (alpha, beta) = (float(w[0] / k), float(w[1] / k))
+    return (alpha, beta), k, before, after
+
+
+def write_weights(alpha, beta, path=WEIGHTS_PATH, **info):
+    with open(path, 'w') as f:
+        json.dump(dict({'alpha': alpha, 'beta': beta}, **info), f, indent=2)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='fit the heuristic weights to the outcomes of stored positions')
+    parser.add_argument('directory', help='shard directory written by Dataset.py generate')
+    parser.add_argument('--out', default=WEIGHTS_PATH, help='weights file, Game.py reads weights.json at startup')
+    parser.add_argument('--dry-run', action='store_true', help='only print the fitted weights')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    (features, targets) = load_features(args.directory)
+    loaded = time.perf_counter()
+    try:
+        ((alpha, beta), k, before, after) = tune(features, targets)
+    except ValueError as error:
+        raise SystemExit('{} positions, no weights written: {}'.format(len(targets), error))
+    fitted = time.perf_counter()
+
+    print('{} positions, features in {:.1f} s, fit in {:.1f} s'.format(len(targets), loaded - start, fitted - loaded))
+    print('scale k {:.3f}, loss {:.5f} with alpha {} beta {}'.format(k, before, *DEFAULT_WEIGHTS))
+    print('tuned alpha {:.4f} beta {:.4f}, loss {:.5f}'.format(alpha, beta, after))
+    # a heuristic value of 1 or more would look better to the search than a win
+    largest = float(np.abs(features @ np.array([alpha, beta])).max()) if len(targets) else 0.0
+    print('largest heuristic value {:.3f}{}'.format(largest, '' if largest < 1 else ', above the win score of 1'))
+    if not args.dry_run:
+        write_weights(alpha, beta, args.out, positions=len(targets), loss=after)
+        print('written to {}'.format(args.out))
+
+
+if __name__ == '__main__':
+    main()